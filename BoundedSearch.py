@@ -0,0 +1,295 @@
+"""
+memory bounded best first search over compact states.
+
+a ToolpathProblem state is [Grid, Line, Point, distance], with a deep copied Grid per node. here a state is just
+    bits: Python int bitset, bit i set if LineSet line i has been printed
+    end: endpoint id the nozzle is at (2*line id + end, see LineSet), or -1 for the start point
+which is a few dozen bytes for grids with hundreds of lines, hashes cheaply, and is all that's needed: lines in a tile
+are printed in order, so each tile's "next line" counter is just the number of set bits in its id range.
+
+the search is A* (f = g + cost of the cheapest next travel, which is admissible) with duplicate states merged through a
+dict. live nodes are counted against max_bytes; when the ceiling is hit the worst f leaves are forgotten SMA* style:
+their f is backed up into the parent, which remembers it per action and goes back on the frontier at the best such f,
+so the forgotten children are regenerated at their backed up f if they become the best option again (children backed
+up as dead ends are never regenerated). the result is optimal as long as memory holds the best path to the goal along
+with its frontier. once the ceiling is too small for that (a node's path and children don't fit under it, forgetting
+can't get back under it, or THRASH_PRUNES prunes go by without the best f on the frontier rising, so the same subtrees
+are only being forgotten and regenerated) searching on would only thrash, so every node in memory is finished
+greedily (nearest printable line next), the cheapest of those is returned and stats["optimal"] is False.
+"""
+
+import heapq
+import sys
+import numpy as np
+
+
+NODE_BYTES = 240  # rough per node overhead (node object, heap entry, dict entry) on top of the bitset itself
+FORGOTTEN_BYTES = 100  # rough size of one backed up f remembered by a parent
+THRASH_PRUNES = 64  # prunes without progress in f before the search gives up on optimality
+
+
+class SearchNode:
+    __slots__ = ("bits", "end", "g", "f", "depth", "parent", "action", "children", "forgotten", "in_frontier", "live")
+
+    def __init__(self, bits, end, g, f, depth, parent, action):
+        self.bits = bits
+        self.end = end
+        self.g = g
+        self.f = f
+        self.depth = depth
+        self.parent = parent
+        self.action = action  # (line id, entry end) that led here
+        self.children = 0  # live children
+        self.forgotten = {}  # action -> backed up f of a forgotten child
+        self.in_frontier = False
+        self.live = True
+
+    def key(self):
+        return (self.bits, self.end)
+
+    def size(self):
+        return sys.getsizeof(self.bits) + NODE_BYTES
+
+    def path(self):
+        actions = []
+        node = self
+        while node.parent is not None:
+            actions.append(node.action)
+            node = node.parent
+        return actions[::-1]
+
+
+def encodeProblemState(line_set, state):
+    """
+    compact (bits, end) for a ToolpathProblem state [Grid, Line, Point, distance]. the state's grid must have the same
+    lines as line_set's grid (eg. a deep copy of it), since lines are matched by position
+    """
+    grid, _, point = state[0], state[1], state[2]
+    bits = 0
+    for i, line in enumerate(grid.getLines()):
+        if line.traversed:
+            bits |= 1 << i
+    end = -1
+    if point is not None:
+        d = np.hypot(*(line_set.ends.reshape(-1, 2) - (point.x, point.y)).T)
+        end = int(np.argmin(d)) if len(d) > 0 and d.min() < 10**(-5) else -1
+    return bits, end
+
+
+class BoundedSearch:
+    def __init__(self, line_set, max_bytes=64 * 2**20, start_point=None):
+        self.line_set = line_set
+        self.max_bytes = max_bytes
+        self.start_point = start_point
+        self.matrix = line_set.travelMatrix()
+        self.start_costs = None if start_point is None else line_set.travelFrom(start_point).reshape(-1)
+        self.full = (1 << len(line_set)) - 1
+        self.tile_masks = [[((1 << line_set.tile_count[i][j]) - 1) << line_set.tile_start[i][j] for j in range(line_set.num_columns)] for i in range(line_set.num_rows)]
+
+        self.frontier = []
+        self.explored = {}  # (bits, end) -> live node with that state
+        self.counter = 0  # heap tie breaker
+        self.bytes = 0
+        self.best_f = -np.inf  # highest f expanded so far, A* works through f in rising order
+        self.stalled_prunes = 0  # prunes since best_f last rose
+        self.stats = {"created": 0, "expanded": 0, "forgotten": 0, "peak_bytes": 0, "optimal": True}
+
+    # compact state helpers
+    def counters(self, bits):
+        ls = self.line_set
+        return [[(bits & self.tile_masks[i][j]).bit_count() for j in range(ls.num_columns)] for i in range(ls.num_rows)]
+
+    def travel(self, end, action):
+        line_id, entry = action
+        if end == -1:
+            return 0 if self.start_costs is None else self.start_costs[2*line_id + entry]
+        return self.matrix[end, 2*line_id + entry]
+
+    def heuristic(self, bits, end, printable=None):
+        """
+        cost of the cheapest next travel, 0 at the goal
+        """
+        if bits == self.full:
+            return 0
+        printable = self.line_set.printable(self.counters(bits)) if printable is None else printable
+        return min(self.travel(end, (line_id, e)) for line_id in printable for e in (0, 1))
+
+    # node bookkeeping
+    def _push(self, node):
+        node.in_frontier = True
+        self.counter += 1
+        heapq.heappush(self.frontier, (node.f, -node.depth, self.counter, node))
+
+    def _add(self, node):
+        self.bytes += node.size()
+        self.stats["created"] += 1
+        self.stats["peak_bytes"] = max(self.stats["peak_bytes"], self.bytes)
+        self.explored[node.key()] = node
+        if node.parent is not None:
+            node.parent.children += 1
+        self._push(node)
+
+    def _release(self, node, backed_up_f):
+        """
+        drop a node from memory, backing up backed_up_f into its parent (inf for dead ends)
+        """
+        node.live = False
+        node.in_frontier = False
+        self.bytes -= node.size() + FORGOTTEN_BYTES * len(node.forgotten)
+        if self.explored.get(node.key()) is node:
+            del self.explored[node.key()]
+        parent = node.parent
+        if parent is None or not parent.live:
+            return
+        parent.children -= 1
+        if node.action not in parent.forgotten:
+            self.bytes += FORGOTTEN_BYTES
+        parent.forgotten[node.action] = min(parent.forgotten.get(node.action, np.inf), backed_up_f)
+        best = min(parent.forgotten.values())
+        if parent.children == 0 and best == np.inf and not parent.in_frontier:  # nothing below reaches the goal
+            self._release(parent, np.inf)
+        elif best < np.inf and (not parent.in_frontier or best < parent.f):
+            # SMA*: the parent competes on the frontier with its best forgotten child, so that child is regenerated
+            # before anything worse reaches the goal
+            parent.f = best
+            self._push(parent)
+
+    @staticmethod
+    def _pathBytes(node):
+        size = 0
+        while node is not None:
+            size += node.size()
+            node = node.parent
+        return size
+
+    def _complete(self, node):
+        """
+        (cost, actions) of the nearest printable line next from node's state to the goal
+        """
+        bits, end, g = node.bits, node.end, node.g
+        counters = self.counters(bits)
+        actions = []
+        while bits != self.full:
+            action = min(((c, e) for c in self.line_set.printable(counters) for e in (0, 1)), key=lambda a: self.travel(end, a))
+            g += self.travel(end, action)
+            self.line_set.advance(counters, action[0])
+            bits |= 1 << action[0]
+            end = 2*action[0] + 1 - action[1]
+            actions.append(action)
+        return g, actions
+
+    def _bestCompletion(self):
+        """
+        cheapest greedy completion of any node in memory, for when memory is too small to search on. memory is small
+        then, so trying every node is cheap, and the root's completion is plain greedy
+        """
+        best_cost, best_order = np.inf, None
+        for node in list(self.explored.values()):
+            cost, actions = self._complete(node)
+            if cost < best_cost:
+                best_cost, best_order = cost, node.path() + actions
+        return best_order
+
+    def _prune(self):
+        """
+        forget the worst leaves until memory is back under 90% of the ceiling
+        """
+        entries = [e for e in self.frontier if e[3].in_frontier and e[3].live and e[3].children == 0]
+        entries.sort(key=lambda e: (e[0], e[1]))
+        while self.bytes > .9 * self.max_bytes and len(entries) > 1:
+            node = entries.pop()[3]
+            if not node.in_frontier or not node.live or node.children > 0:
+                continue
+            self.stats["forgotten"] += 1
+            self._release(node, node.f)
+        if self.bytes > self.max_bytes:  # nothing left to forget but the best leaf and the paths above the frontier
+            self.stats["optimal"] = False
+        self.stalled_prunes += 1
+        if self.stalled_prunes > THRASH_PRUNES:  # forgetting and regenerating the same subtrees without getting anywhere
+            self.stats["optimal"] = False
+        self.frontier = [e for e in self.frontier if e[3].in_frontier and e[3].live]
+        heapq.heapify(self.frontier)
+
+    def search(self, initial=(0, -1), max_expansions=None):
+        """
+        search from initial (bits, end). returns the remaining sequence as a list of (line id, entry end), or None if
+        max_expansions ran out first
+        """
+        bits, end = initial
+        root = SearchNode(bits, end, 0, 0, bits.bit_count(), None, None)
+        root.f = self.heuristic(bits, end)
+        self._add(root)
+
+        while len(self.frontier) > 0:
+            _, _, _, node = heapq.heappop(self.frontier)
+            if not node.in_frontier or not node.live:  # stale entry
+                continue
+            node.in_frontier = False
+            if node.bits == self.full:
+                return node.path()
+            if not self.stats["optimal"]:  # memory is too small to search on
+                return self._bestCompletion()
+            if max_expansions is not None and self.stats["expanded"] >= max_expansions:
+                return None
+            self.stats["expanded"] += 1
+            if node.f > self.best_f:
+                self.best_f = node.f
+                self.stalled_prunes = 0
+
+            regenerating = len(node.forgotten) > 0  # only the best forgotten children, SMA* style
+            counters = self.counters(node.bits)
+            for line_id in self.line_set.printable(counters):
+                child_bits = node.bits | (1 << line_id)
+                child_printable = None
+                for entry in (0, 1):
+                    child_end = 2*line_id + 1 - entry
+                    backed_up_f = node.forgotten.get((line_id, entry))
+                    if regenerating and (backed_up_f is None or backed_up_f > node.f):
+                        continue
+                    if backed_up_f is not None:
+                        del node.forgotten[(line_id, entry)]
+                        self.bytes -= FORGOTTEN_BYTES
+                        if backed_up_f == np.inf:  # dead end, or superseded by a cheaper path
+                            continue
+                    g = node.g + self.travel(node.end, (line_id, entry))
+                    existing = self.explored.get((child_bits, child_end))
+                    if existing is not None and existing.g <= g:
+                        continue
+                    if existing is not None and existing.in_frontier:
+                        self._release(existing, np.inf)  # superseded by a cheaper path
+                    if child_printable is None:
+                        child_counters = [row[:] for row in counters]
+                        self.line_set.advance(child_counters, line_id)
+                        child_printable = self.line_set.printable(child_counters)
+                    h = 0 if child_bits == self.full else min(self.matrix[child_end, 2*c + e] for c in child_printable for e in (0, 1))
+                    f = g + h if backed_up_f is None else max(g + h, backed_up_f)  # a regenerated child keeps what it learned
+                    self._add(SearchNode(child_bits, child_end, g, f, node.depth + 1, node, (line_id, entry)))
+
+            best = min(node.forgotten.values(), default=np.inf)
+            if best < np.inf:  # back on the frontier for the next forgotten child
+                node.f = best
+                self._push(node)
+            elif node.children == 0:
+                self._release(node, np.inf)
+            if self._pathBytes(node) + node.children * node.size() > .9 * self.max_bytes:
+                # node at the memory limit: forgetting can't make room for anything below its children
+                self.stats["optimal"] = False
+            if self.bytes > self.max_bytes:
+                self._prune()
+        return None
+
+
+if __name__ == "__main__":
+    from Grid import Grid
+    from LineSet import LineSet
+
+    grid = Grid(1, 2, -45, 0, 1, .25)
+    grid.randomGenAngles(-45, 45)
+    grid.genTileLines()
+    line_set = LineSet(grid)
+    greedy = line_set.greedyOrder((0, 0))
+    print(len(line_set), "lines. greedy:", round(line_set.travelCost(greedy, (0, 0)), 4))
+    for max_bytes in (2**30, 64 * 2**10):
+        search = BoundedSearch(line_set, max_bytes, start_point=(0, 0))
+        order = search.search()
+        print(max_bytes, "bytes:", round(line_set.travelCost(order, (0, 0)), 4), line_set.isFeasible(order), search.stats)
@@ -0,0 +1,98 @@
+"""
+cost models for scoring toolpath sequences.
+
+a cost model prices the two kinds of moves in a print: non-extruding travel between lines, and printing a line. all
+methods take arrays of points so whole sequences are priced in one call, and the scalar helpers just wrap them.
+
+DistanceCostModel is what the searches have always used (travel distance, printing is free). TrapezoidalTimeModel
+gives actual machine time: every move accelerates from the jerk speed up to its max speed (or as far as it gets) and
+decelerates back down, since each move starts and ends at a direction change.
+"""
+
+import numpy as np
+
+
+class CostModel:
+    def travelCosts(self, from_points, to_points):
+        """
+        cost of travelling from each of from_points to the matching to_points, both (N, 2) arrays
+        """
+        raise NotImplementedError
+
+    def printCosts(self, lengths):
+        """
+        cost of printing lines with the given lengths (N array)
+        """
+        raise NotImplementedError
+
+    def travelCost(self, p0, p1):
+        """
+        travel cost between two Points
+        """
+        return float(self.travelCosts(np.array([[p0.x, p0.y]]), np.array([[p1.x, p1.y]]))[0])
+
+    def printCost(self, line):
+        """
+        cost of printing a Line (or Polyline)
+        """
+        return float(self.printCosts(np.array([line.length()]))[0])
+
+
+class DistanceCostModel(CostModel):
+    """
+    straight line travel distance. printing costs nothing, since the time spent extruding is the same for every sequence
+    """
+    def travelCosts(self, from_points, to_points):
+        diff = np.asarray(to_points, dtype=float) - np.asarray(from_points, dtype=float)
+        return np.hypot(diff[..., 0], diff[..., 1])
+
+    def printCosts(self, lengths):
+        return np.zeros(np.shape(lengths))
+
+
+class TrapezoidalTimeModel(CostModel):
+    """
+    move time under a trapezoidal velocity profile.
+    travel_speed: max speed for non-extruding travel
+    print_speed: max speed while extruding
+    acceleration: max acceleration (and deceleration)
+    jerk: speed the machine can change direction at instantly, ie. the speed every move starts and ends at
+    travel_overhead: fixed time added to every travel (retract/unretract, z hop). not added for zero length travel
+    all units just need to be consistent with the grid's length unit
+    """
+    def __init__(self, travel_speed, print_speed, acceleration, jerk=0, travel_overhead=0):
+        if acceleration <= 0:
+            raise ValueError("acceleration must be positive")
+        self.travel_speed = travel_speed
+        self.print_speed = print_speed
+        self.acceleration = acceleration
+        self.jerk = jerk
+        self.travel_overhead = travel_overhead
+
+    def moveTimes(self, distances, max_speed):
+        """
+        time to cover each distance starting and ending at the jerk speed, never going over max_speed
+        """
+        d = np.asarray(distances, dtype=float)
+        a = self.acceleration
+        v0 = min(self.jerk, max_speed)
+        ramp = (max_speed**2 - v0**2) / a  # distance spent accelerating plus decelerating to reach max_speed
+        peak = np.sqrt(v0**2 + a*np.minimum(d, ramp))  # top speed actually reached
+        ramp_time = 2 * (peak - v0) / a
+        cruise_time = np.maximum(d - ramp, 0) / max_speed
+        return ramp_time + cruise_time
+
+    def travelCosts(self, from_points, to_points):
+        diff = np.asarray(to_points, dtype=float) - np.asarray(from_points, dtype=float)
+        d = np.hypot(diff[..., 0], diff[..., 1])
+        return self.moveTimes(d, self.travel_speed) + np.where(d > 10**(-9), self.travel_overhead, 0)
+
+    def printCosts(self, lengths):
+        return self.moveTimes(lengths, self.print_speed)
+
+
+if __name__ == "__main__":
+    model = TrapezoidalTimeModel(travel_speed=150, print_speed=40, acceleration=1000, jerk=10)
+    d = np.array([0, .1, 1, 10, 100])
+    print(model.moveTimes(d, 150))
+    print(d / 150)
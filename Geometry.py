@@ -0,0 +1,167 @@
+"""
+parametric geometry kernel used by Line and Tile.
+
+lines are handled as point + t * direction instead of slope/intercept, so vertical, horizontal and corner cases all go
+through the same code. clipping against a tile is Liang-Barsky: each of the four tile borders is a half plane, and the
+part of the line inside all four is the range of t left after intersecting the four constraints.
+
+every function takes NumPy arrays so a whole batch of lines can be handled in one call. single lines are just a batch
+of one.
+"""
+
+import numpy as np
+
+
+EPS = 10**(-9)  # parametric tolerance. geometric tolerances (like Point.__eq__) are larger and applied by callers
+
+
+def cross(a, b):
+    """
+    z component of the cross product of 2D vectors (or arrays of vectors, shape (..., 2))
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    return a[..., 0]*b[..., 1] - a[..., 1]*b[..., 0]
+
+
+def directionFromAngle(angle):
+    """
+    unit direction vector(s) for angle(s) in degrees, counter clockwise from +x. components within EPS of zero are
+    snapped to exactly zero, so 90 degrees gives a truly vertical direction instead of one with a 1e-17 x component
+    """
+    rad = np.asarray(angle, dtype=float) * (np.pi / 180)
+    d = np.stack((np.cos(rad), np.sin(rad)), axis=-1)
+    d[np.abs(d) < EPS] = 0
+    return d
+
+
+def orthogonalNormal(direction):
+    """
+    unit normal of a line with the given direction, picked the way Line.translateOrthogonal moves lines: generally to the
+    right, or up for a horizontal line. (the direction is first oriented into the angle range (0, 180] degrees)
+    """
+    dx, dy = float(direction[0]), float(direction[1])
+    if dy < 0 or (dy == 0 and dx > 0):
+        dx, dy = -dx, -dy
+    length = np.hypot(dx, dy)
+    return np.array((dy / length, -dx / length))
+
+
+def clipToBox(points, directions, box):
+    """
+    clip infinite lines against an axis aligned box (Liang-Barsky).
+    points: (N, 2) point on each line
+    directions: (N, 2) direction of each line (need not be unit length)
+    box: (x_min, y_min, x_max, y_max)
+    returns (t0, t1, valid): for valid lines, points + t*directions for t in [t0, t1] is the part of the line inside the
+    box. a line that only touches the box at a corner gives t0 == t1, a line along a border is kept.
+    """
+    points = np.atleast_2d(np.asarray(points, dtype=float))
+    directions = np.atleast_2d(np.asarray(directions, dtype=float))
+    n = len(points)
+    x_min, y_min, x_max, y_max = box
+
+    # four half planes: p*t <= q
+    p = np.stack((-directions[:, 0], directions[:, 0], -directions[:, 1], directions[:, 1]), axis=1)
+    q = np.stack((points[:, 0] - x_min, x_max - points[:, 0], points[:, 1] - y_min, y_max - points[:, 1]), axis=1)
+
+    t0 = np.full(n, -np.inf)
+    t1 = np.full(n, np.inf)
+    valid = np.ones(n, dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = q / p
+    for k in range(4):
+        parallel = np.abs(p[:, k]) < EPS
+        valid &= ~(parallel & (q[:, k] < -EPS))  # parallel to and outside of this border
+        entering = ~parallel & (p[:, k] < 0)
+        leaving = ~parallel & (p[:, k] > 0)
+        t0 = np.where(entering, np.maximum(t0, r[:, k]), t0)
+        t1 = np.where(leaving, np.minimum(t1, r[:, k]), t1)
+    valid &= t0 <= t1 + EPS
+    return t0, t1, valid
+
+
+def clipSegments(points, directions, box, min_length=0):
+    """
+    clip infinite lines to a box and return the resulting segments.
+    returns (segments, valid): segments has shape (N, 2, 2) as [[x0, y0], [x1, y1]] per line. a line is only valid if
+    its clipped segment is longer than min_length, so lines that only touch a corner are rejected.
+    """
+    points = np.atleast_2d(np.asarray(points, dtype=float))
+    directions = np.atleast_2d(np.asarray(directions, dtype=float))
+    t0, t1, valid = clipToBox(points, directions, box)
+    t0 = np.where(valid, t0, 0)
+    t1 = np.where(valid, t1, 0)
+    segments = np.stack((points + t0[:, None]*directions, points + t1[:, None]*directions), axis=1)
+    lengths = np.hypot(*(segments[:, 1] - segments[:, 0]).T)
+    valid &= lengths > max(min_length, EPS)
+    return segments, valid
+
+
+def orderByBorder(segments, box):
+    """
+    swap the ends of (N, 2, 2) clipped segments so that each segment starts on the earlier border in left, top, right,
+    bottom order (the order lines have always been built in, so p0 and p1 keep their meaning). a corner counts as the
+    earlier of its two borders. returns a new array
+    """
+    segments = np.array(segments, dtype=float).reshape(-1, 2, 2)
+    x_min, y_min, x_max, y_max = box
+    tol = 10**(-7) * max(x_max - x_min, y_max - y_min, 1)
+    x, y = segments[..., 0], segments[..., 1]
+    rank = np.select([np.abs(x - x_min) < tol, np.abs(y - y_max) < tol, np.abs(x - x_max) < tol], [0, 1, 2], 3)
+    swap = rank[:, 0] > rank[:, 1]
+    segments[swap] = segments[swap, ::-1]
+    return segments
+
+
+def orthogonalDistance(line_points, line_directions, points):
+    """
+    orthogonal distance from points to the infinite lines through line_points with line_directions. all arguments
+    broadcast, so one line against many points or many lines against one point both work.
+    """
+    line_points = np.asarray(line_points, dtype=float)
+    line_directions = np.asarray(line_directions, dtype=float)
+    points = np.asarray(points, dtype=float)
+    return np.abs(cross(line_directions, points - line_points)) / np.hypot(line_directions[..., 0], line_directions[..., 1])
+
+
+def isBelow(points, line_points, line_directions):
+    """
+    True where points are strictly below the infinite lines through line_points with line_directions (broadcasting like
+    orthogonalDistance). below is the right hand side of the direction oriented into (-90, 90] degrees: y < f(x) for a
+    line with a slope, and for a vertical line, which has none, the +x side (the limit of a steep line leaning right)
+    """
+    line_points = np.asarray(line_points, dtype=float)
+    line_directions = np.asarray(line_directions, dtype=float)
+    points = np.asarray(points, dtype=float)
+    flip = (line_directions[..., 0] < 0) | ((line_directions[..., 0] == 0) & (line_directions[..., 1] < 0))
+    line_directions = np.where(flip[..., None], -line_directions, line_directions)
+    return cross(line_directions, points - line_points) < 0
+
+
+def intersectLines(a_points, a_directions, b_points, b_directions):
+    """
+    intersection of infinite lines a and b (broadcasting like orthogonalDistance).
+    returns (t, u, valid): the intersection is a_points + t*a_directions == b_points + u*b_directions. parallel and
+    colinear pairs are not valid.
+    """
+    a_points = np.asarray(a_points, dtype=float)
+    a_directions = np.asarray(a_directions, dtype=float)
+    b_points = np.asarray(b_points, dtype=float)
+    b_directions = np.asarray(b_directions, dtype=float)
+    denom = cross(a_directions, b_directions)
+    scale = np.hypot(a_directions[..., 0], a_directions[..., 1]) * np.hypot(b_directions[..., 0], b_directions[..., 1])
+    valid = np.abs(denom) > EPS * scale
+    diff = b_points - a_points
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(valid, cross(diff, b_directions) / denom, np.nan)
+        u = np.where(valid, cross(diff, a_directions) / denom, np.nan)
+    return t, u, valid
+
+
+if __name__ == "__main__":
+    d = directionFromAngle([0, 45, 90, -30])
+    print(d)
+    print(clipSegments(np.full((4, 2), .5), d, (0, 0, 1, 1)))
+    print(clipSegments([[0, 0]], [[1, 1]], (0, 1, 1, 2)))  # touches corner (1, 1) only, not valid
+    print(clipSegments([[0, 1]], [[1, 0]], (0, 1, 1, 2)))  # along bottom border, valid
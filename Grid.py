@@ -24,6 +24,7 @@ from random import random
 from Tile import Tile
 from Line import Line
 from Point import Point
+from Polyline import Polyline
 
 
 class Grid:
@@ -35,6 +36,7 @@ class Grid:
         self.max_angle = max_angle
         self.min_angle = min_angle
         self.tiles = []  # a 2D list of tiles, w/ [0][0] at bottom left (vertically flipped from standard 2d matrix representation)
+        self.polylines = None  # set by mergeTileLines. when not None, these are the units the search prints
         for i in range(self.num_rows):
             curr_row = []
             for j in range(self.num_columns):
@@ -51,6 +53,30 @@ class Grid:
                 ret_lines += tile.lines
         return ret_lines
 
+    def getPrintUnits(self):
+        """
+        return the things the search treats as single actions: the merged polylines if mergeTileLines has been called,
+        otherwise the individual tile lines
+        """
+        return self.polylines if self.polylines is not None else self.getLines()
+
+    def getUnprintedUnits(self):
+        """
+        like getPrintUnits, but polylines that have been partly printed are split into their unprinted runs
+        """
+        if self.polylines is None:
+            return self.getLines()
+        return [run for polyline in self.polylines for run in polyline.untraversedRuns()]
+
+    def mergeTileLines(self, tol=10**(-5)):
+        """
+        fuse tile lines whose endpoints coincide (within tol) across tile borders into polylines. must be called after
+        genTileLines, and again whenever the lines are regenerated
+        """
+        for line in self.getLines():
+            line.polyline = None
+        self.polylines = Polyline.mergeLines(self.getLines(), tol)
+
     def numLinesTraversed(self):
         ret_val = 0
         for line in self.getLines():
@@ -78,7 +104,9 @@ class Grid:
         """
         for i in range(len(angle_array)):  # rows
             for j in range(len(angle_array[i])):  # columns
-                self.tiles[i][j].angle = angle_array[i][j]
+                if self.tiles[i][j].angle != angle_array[i][j]:
+                    self.tiles[i][j].angle = angle_array[i][j]
+                    self.tiles[i][j].dirty = True
 
     def randomGenAngles(self, start_angle, deviation_range):
         """
@@ -122,9 +150,12 @@ class Grid:
 
                     self.tiles[i][j].setAngle(new_angle)
     
-    def genTileLines(self):
+    def genTileLines(self, templates=None):
         """
         generate the lines in each tile. currently generates line series with appropriate spacing and angle. seed line goes through tile center.
+
+        templates: optional dict, shared between grids (e.g. the layers of a print), of tile line templates keyed by
+        (angle, side length, spacing). tiles whose key is already in it copy the template instead of regenerating lines.
         
         old algo (not in use):
             1- generate seed tile lines.
@@ -133,9 +164,10 @@ class Grid:
                close as possible to the intended angle
         """
 
+        self.polylines = None  # any merge is stale once the lines are regenerated
         for i in range(len(self.tiles)):
             for j in range(len(self.tiles[0])):
-                self.tiles[i][j].genLinesFromPoint(self.tiles[i][j].center)
+                self._genTile(self.tiles[i][j], templates)
 
         # # this code generates continuous lines, which was the original aim of the project. not enough time, so doing non-continuous lines.
         # # ------------------------
@@ -161,6 +193,35 @@ class Grid:
         #         else:  # has a tile both to the left and below it
         #             pass
 
+    def _genTile(self, tile, templates):
+        """
+        generate one tile's lines through its center, via the templates dict if one is given
+        """
+        if templates is None:
+            tile.genLinesFromPoint(tile.center)
+            return
+        key = (round(float(tile.angle), 9), tile.w, tile.s_max)
+        if key in templates:
+            tile.genLinesFromTemplate(templates[key])
+        else:
+            tile.genLinesFromPoint(tile.center)
+            templates[key] = tile.getTemplate()
+
+    def regenDirtyTiles(self, templates=None):
+        """
+        regenerate lines only in tiles whose angle changed since their lines were generated (Tile.dirty). returns the
+        (row, column) of every regenerated tile, in row major order, eg. for LineSet.updateTiles
+        """
+        regenerated = []
+        for i in range(self.num_rows):
+            for j in range(self.num_columns):
+                if self.tiles[i][j].dirty:
+                    self._genTile(self.tiles[i][j], templates)
+                    regenerated.append((i, j))
+        if len(regenerated) > 0:
+            self.polylines = None  # merge is stale, call mergeTileLines again if needed
+        return regenerated
+
     def getPrintableLines(self):
         """
         return a list of line objects that are printable given the current grid state
@@ -183,11 +244,28 @@ class Grid:
                     printable_tiles_searched += 1
                 elif printable_tiles_searched == 1:
                     prev_line = ret_lines[-1]  # this will be the printable line in the tile below
-                    if lines[k].p0.y < prev_line.f(lines[k].p0.x) and lines[k].p1.y < prev_line.f(lines[k].p1.x):
+                    if lines[k].isBelow(prev_line):
                         ret_lines.append(lines[k])
                     break
-                
-        return ret_lines
+
+        if self.polylines is None:
+            return ret_lines
+
+        # a polyline is printable once every one of its remaining segments is. if merging has tied segments together such
+        # that no polyline can go next, fall back to the printable segments on their own so the search can't dead end.
+        # a polyline with segments printed that way is only offered as its unprinted runs, never again as a whole
+        printable = set(id(line) for line in ret_lines)
+        seen = set()
+        ret_polylines = []
+        for line in ret_lines:
+            polyline = line.polyline
+            if polyline is None or id(polyline) in seen:
+                continue
+            seen.add(id(polyline))
+            for run in polyline.untraversedRuns():
+                if all(id(seg) in printable for seg in run.lines):
+                    ret_polylines.append(run)
+        return ret_polylines if len(ret_polylines) > 0 else ret_lines
 
                 
 def showGridLines(grid, point_sequence=None, line_sequence=None):
@@ -229,7 +307,7 @@ def showGridLines(grid, point_sequence=None, line_sequence=None):
                 last_line = Line(point_sequence[2*i - 1], point_sequence[2*i])
                 ax.plot((last_line.p0.x, last_line.p1.x), (last_line.p0.y, last_line.p1.y), color='b', lw=2)
             line = line_sequence[i]
-            ax.plot((line.p0.x, line.p1.x), (line.p0.y, line.p1.y), color='r', lw=2)
+            ax.plot(line.xList(), line.yList(), color='r', lw=2)  # polylines plot all of their points
 
     # # data labels (ordering)
     # if point_sequence is not None:
@@ -0,0 +1,202 @@
+"""
+asyncio interface for long running sequencing.
+
+    job = await submit(GridSpec(angles, 1, .1))
+    async for event in job.events():  # best so far, as the search improves it
+        print(event)
+    layer = await job.result()
+
+the solve itself (LineSet greedy start + improveOrder) is CPU bound, so it runs in an executor: the event loop's
+default thread pool, or another thread pool if one is given. progress and cancellation are shared in memory, and events
+come back through the loop with call_soon_threadsafe. job.cancel() stops the job after its current phase (cache lookup,
+lower bound, greedy start) or at the search's next progress check, and result() then raises asyncio.CancelledError.
+many jobs can be driven from one loop at once. with a SolutionCache, a grid that has been solved before finishes
+straight from the cache. every event carries the optimality gap against the grid's lower bound (LowerBound.lowerBound),
+and a spec with a target_gap finishes as soon as the gap is that small. the bound is stored with the cached solution,
+so a hit reports the same gap without recomputing it (None for entries stored without one).
+"""
+
+import asyncio
+import threading
+import time
+from Grid import Grid
+from LayerPlanner import Layer
+from LineSet import LineSet
+from LowerBound import lowerBound, optimalityGap
+
+
+class GridSpec:
+    """
+    everything needed to build and solve one grid.
+    angles: 2D list of tile angles, row 0 at the bottom (same as Grid.seedAngles)
+    target_gap: optional optimality gap to stop the search at, eg. .05 to stop once the sequence is provably within 5%.
+        only reachable where LowerBound is tight: a few tiles, not 8x8 and up (see LineSet.improveOrder)
+    """
+    def __init__(self, angles, tile_side_length, seed_tile_offset, start_point=(0, 0), min_angle=-45, max_angle=0, cost_model=None, max_passes=None, target_gap=None):
+        self.angles = angles
+        self.w = tile_side_length
+        self.offset = seed_tile_offset
+        self.start_point = start_point
+        self.min_angle = min_angle
+        self.max_angle = max_angle
+        self.cost_model = cost_model
+        self.max_passes = max_passes
+        self.target_gap = target_gap
+
+    def buildLineSet(self):
+        grid = Grid(len(self.angles), len(self.angles[0]), self.min_angle, self.max_angle, self.w, self.offset)
+        grid.seedAngles(self.angles)
+        grid.genTileLines()
+        return LineSet(grid, self.cost_model)
+
+
+class ProgressEvent:
+    """
+    states: candidate sequences evaluated so far (like the St column of InstrumentedProblem)
+    passes: local search passes started
+    best_cost: cost of order, the best sequence found so far
+    gap: optimality gap of best_cost, (best_cost - lower bound) / best_cost. None if the bound isn't known
+    done: True on the last event of a job that finished normally
+    """
+    def __init__(self, states, passes, best_cost, order, gap, done=False):
+        self.states = states
+        self.passes = passes
+        self.best_cost = best_cost
+        self.order = order
+        self.gap = gap
+        self.done = done
+
+    def __repr__(self):
+        gap = "" if self.gap is None else f" (gap {round(100 * self.gap, 1)}%)"
+        return f"{'done' if self.done else 'progress'}: {self.states} states, {self.passes} passes, best {round(self.best_cost, 4)}{gap}"
+
+
+class SolveJob:
+    """
+    handle for one submitted solve. create with submit()
+    """
+    def __init__(self, spec, executor=None, min_interval=.1, cache=None):
+        self.spec = spec
+        self.cache = cache  # optional SolutionCache
+        self.min_interval = min_interval  # min seconds between progress events
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._cancel = threading.Event()
+        self._future = self._loop.run_in_executor(executor, self._run)
+
+    def _post(self, event):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+
+    def _run(self):
+        """
+        runs in the executor
+        """
+        t = time.time()
+        try:
+            if self.cache is not None:
+                layer = self.cache.loadSolution(self.spec)
+                if self._cancel.is_set():
+                    return None
+                if layer is not None:
+                    gap = None if layer.bound is None else layer.gap()  # no bound computed on a hit
+                    self._post(ProgressEvent(0, layer.passes, layer.cost(), list(layer.order), gap, done=True))
+                    return layer
+                line_set = self.cache.lineSet(self.spec)
+            else:
+                line_set = self.spec.buildLineSet()
+            if self._cancel.is_set():
+                return None
+            bound = lowerBound(line_set, self.spec.start_point)
+            if self._cancel.is_set():
+                return None
+            order = line_set.greedyOrder(self.spec.start_point)
+            if self._cancel.is_set():
+                return None
+            cost = line_set.cost(order, self.spec.start_point)
+            self._post(ProgressEvent(0, 0, cost, list(order), optimalityGap(cost, bound)))
+            last_post = [time.time()]
+
+            def callback(order, passes, states):  # the local search only ever improves, so order is always the best so far
+                if self._cancel.is_set():
+                    return True
+                if time.time() - last_post[0] >= self.min_interval:
+                    last_post[0] = time.time()
+                    cost = line_set.cost(order, self.spec.start_point)
+                    self._post(ProgressEvent(states, passes, cost, list(order), optimalityGap(cost, bound)))
+                return False
+
+            order, passes = line_set.improveOrder(order, self.spec.start_point, self.spec.max_passes, callback, bound=bound, target_gap=self.spec.target_gap)
+            if self._cancel.is_set():
+                return None
+            if self.cache is not None:
+                self.cache.storeSolution(self.spec, order, passes, bound)
+            layer = Layer(line_set.grid, line_set, order, self.spec.start_point, time.time() - t, passes, bound)
+            self._post(ProgressEvent(None, passes, layer.cost(), list(order), layer.gap(), done=True))
+            return layer
+        finally:
+            self._post(None)  # end of events
+
+    async def events(self):
+        """
+        async iterator over ProgressEvents, ending when the job finishes or is cancelled
+        """
+        while True:
+            event = await self._queue.get()
+            if event is None:
+                return
+            yield event
+
+    async def result(self):
+        """
+        the solved Layer. raises asyncio.CancelledError if the job was cancelled
+        """
+        layer = await asyncio.shield(self._future)
+        if layer is None:
+            raise asyncio.CancelledError()
+        return layer
+
+    def cancel(self):
+        """
+        ask the job to stop. it stops after its current phase, or during the local search at the next progress check,
+        which happens after every line it tries to move
+        """
+        self._cancel.set()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def done(self):
+        return self._future.done()
+
+
+async def submit(spec, executor=None, min_interval=.1, cache=None):
+    """
+    start solving spec in the background and return its SolveJob. must be called from a running event loop
+    """
+    return SolveJob(spec, executor, min_interval, cache)
+
+
+async def _demo():
+    grid = Grid(4, 4, -45, 0, 1, .1)
+    angles = []
+    for n in range(2):
+        grid.randomGenAngles(-45, 45)
+        angles.append([[grid.tiles[i][j].angle for j in range(grid.num_columns)] for i in range(grid.num_rows)])
+
+    jobs = [await submit(GridSpec(a, 1, .1)) for a in angles]
+
+    async def watch(n, job):
+        async for event in job.events():
+            print(f"job {n}: {event}")
+            if n == 1 and event.states is not None and event.states > 20000:
+                job.cancel()
+        try:
+            print(f"job {n} result: {await job.result()}")
+        except asyncio.CancelledError:
+            print(f"job {n} cancelled")
+
+    await asyncio.gather(*(watch(n, job) for n, job in enumerate(jobs)))
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
@@ -0,0 +1,170 @@
+"""
+multi layer toolpath planning.
+
+a Grid is one layer. a print is a stack of layers whose angle fields are usually rotations or small perturbations of
+each other, so most of the work for one layer can be reused for the next:
+    - hatch templates: tiles with an angle seen before copy their lines instead of regenerating them (Grid.genTileLines)
+    - line sets: a layer whose angle field matches an earlier one reuses that layer's Grid and LineSet, including the
+      endpoint distance matrix. otherwise the new matrix copies the previous layer's entries for tiles with the same lines
+    - sequences: after the first layer, the local search only moves lines a few positions (window), starting both from
+      a plain greedy order and from the last order planned for the same line set, or else the previous layer's order
+      mapped onto the new layer line by line. the better of the two is kept. the first layer gets a full search
+each layer starts at whichever printable line is nearest to where the previous layer ended.
+"""
+
+import time
+import numpy as np
+from Grid import Grid
+from LineSet import LineSet
+from LowerBound import lowerBound, optimalityGap
+
+
+class Layer:
+    """
+    one planned layer
+    """
+    def __init__(self, grid, line_set, order, start_point, solve_time, passes, bound=None):
+        self.grid = grid
+        self.line_set = line_set
+        self.order = order  # list of (line id, entry end), see LineSet
+        self.start_point = start_point  # where the nozzle was before this layer
+        self.solve_time = solve_time
+        self.passes = passes  # local search passes needed
+        self.bound = bound  # lower bound on cost, computed on first use by gap()
+
+    def cost(self):
+        return self.line_set.cost(self.order, self.start_point)
+
+    def gap(self):
+        """
+        optimality gap of this layer's order, (cost - lower bound) / cost
+        """
+        if self.bound is None:
+            self.bound = lowerBound(self.line_set, self.start_point)
+        return optimalityGap(self.cost(), self.bound)
+
+    def endPoint(self):
+        if len(self.order) == 0:
+            return self.start_point
+        return tuple(self.line_set.exitPoint(*self.order[-1]))
+
+    def __repr__(self):
+        gap = "" if self.bound is None else f" (gap {round(100 * self.gap(), 1)}%)"  # the bound is only computed when gap() is asked for
+        return f"{len(self.order)} lines, cost {round(self.cost(), 3)}{gap}, {self.passes} passes, {round(self.solve_time, 3)} s"
+
+
+class LayerPlanner:
+    def __init__(self, num_rows, num_columns, tile_side_length, seed_tile_offset, min_angle=-45, max_angle=0, start_point=(0, 0), cost_model=None, window=20):
+        self.num_rows = num_rows
+        self.num_columns = num_columns
+        self.w = tile_side_length
+        self.offset = seed_tile_offset
+        self.min_angle = min_angle
+        self.max_angle = max_angle
+        self.start_point = start_point  # nozzle position before the first layer
+        self.cost_model = cost_model  # CostModel every layer is planned with, None for travel distance
+        self.window = window  # improveOrder window for layers after the first, None for a full search on every layer
+        self.templates = {}  # hatch templates shared by every layer's grid
+        self.line_sets = {}  # angle field -> LineSet, for layers that repeat an earlier field
+        self.orders = {}  # id of a LineSet -> the last order planned on it
+        self.layers = []
+
+    def _lineSet(self, angle_array):
+        key = np.round(np.asarray(angle_array, dtype=float), 9).tobytes()
+        if key not in self.line_sets:
+            grid = Grid(self.num_rows, self.num_columns, self.min_angle, self.max_angle, self.w, self.offset)
+            grid.seedAngles(angle_array)
+            grid.genTileLines(self.templates)
+            line_set = LineSet(grid, self.cost_model)
+            if len(self.layers) > 0:
+                line_set.reuseTravelMatrix(self.layers[-1].line_set)
+            self.line_sets[key] = line_set
+        return self.line_sets[key]
+
+    def _warmPriority(self, line_set, prev):
+        """
+        priority for each line in line_set from the previous layer's order: a line takes the position of the line in the
+        same tile of the previous layer whose midpoint is nearest its own (ties broken by index in the tile)
+        """
+        position = np.empty(len(prev.order))
+        position[[line_id for line_id, _ in prev.order]] = np.arange(len(prev.order))
+        prev_mids = prev.line_set.ends.mean(axis=1)
+        mids = line_set.ends.mean(axis=1)
+        priority = np.empty(len(line_set))
+        for i in range(line_set.num_rows):
+            for j in range(line_set.num_columns):
+                start, count = line_set.tile_start[i][j], line_set.tile_count[i][j]
+                prev_start, prev_count = prev.line_set.tile_start[i][j], prev.line_set.tile_count[i][j]
+                ids = np.arange(start, start + count)
+                if prev_count == 0:
+                    priority[ids] = len(prev.order) + ids  # no counterpart, goes last
+                    continue
+                d = np.hypot(*(mids[ids, None, :] - prev_mids[None, prev_start:prev_start + prev_count, :]).transpose(2, 0, 1))
+                priority[ids] = position[prev_start + np.argmin(d, axis=1)] + np.arange(count) / (count + 1)
+        return priority
+
+    def planLayer(self, angle_array, max_passes=None, target_gap=None):
+        """
+        build and sequence the next layer, stopping the local search early once the order is within target_gap of the
+        layer's lower bound. returns the new Layer
+        """
+        t = time.time()
+        line_set = self._lineSet(angle_array)
+        prev = self.layers[-1] if len(self.layers) > 0 else None
+        start_point = self.start_point if prev is None else prev.endPoint()
+
+        # candidate starting orders: plain nearest neighbor, the last order used for this exact line set (already locally
+        # optimal, so the search usually stops after one pass), or the previous layer's order mapped onto this one
+        candidates = [line_set.greedyOrder(start_point)]
+        if id(line_set) in self.orders:
+            candidates.append(self.orders[id(line_set)])
+        elif prev is not None:
+            # first line is the printable one nearest the previous layer's end, the rest follow the previous order
+            state = line_set.initialState()
+            first = line_set.nearestPrintable(state, start_point)
+            if first is not None:
+                line_set.advance(state, first[0])
+                candidates.append([first] + line_set.greedyOrder(line_set.exitPoint(*first), self._warmPriority(line_set, prev), state))
+
+        # a start that is worse than greedy can still search to a better order, so every candidate is searched. the
+        # window keeps that cheap: after the first layer orders only need local repairs
+        bound = None if target_gap is None else lowerBound(line_set, start_point)
+        window = None if prev is None else self.window
+        results = [line_set.improveOrder(candidate, start_point, max_passes, window=window, bound=bound, target_gap=target_gap) for candidate in candidates]
+        order, passes = min(results, key=lambda result: line_set.travelCost(result[0], start_point))
+        self.orders[id(line_set)] = order
+        layer = Layer(line_set.grid, line_set, order, start_point, time.time() - t, passes, bound)
+        self.layers.append(layer)
+        return layer
+
+    def plan(self, angle_arrays, max_passes=None, target_gap=None):
+        """
+        plan a whole stack of layers, bottom first. returns the list of Layers
+        """
+        for angle_array in angle_arrays:
+            self.planLayer(angle_array, max_passes, target_gap)
+        return self.layers
+
+
+def rotatedLayers(base_angles, num_layers, rotation, min_angle=-45, max_angle=0):
+    """
+    angle fields for a stack of layers that alternate between the base field and the base field rotated by rotation
+    degrees (clipped to the allowed range), the usual cross hatched pattern
+    """
+    base_angles = np.asarray(base_angles, dtype=float)
+    rotated = np.clip(base_angles + rotation, min_angle, max_angle)
+    return [base_angles if n % 2 == 0 else rotated for n in range(num_layers)]
+
+
+def main():
+    grid = Grid(3, 3, -45, 0, 1, .1)
+    grid.randomGenAngles(-45, 45)
+    base_angles = [[grid.tiles[i][j].angle for j in range(grid.num_columns)] for i in range(grid.num_rows)]
+
+    planner = LayerPlanner(3, 3, 1, .1)
+    for n, layer in enumerate(planner.plan(rotatedLayers(base_angles, 6, 20))):
+        print(f"layer {n}: {layer}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import numpy as np
+import Geometry
 from Point import Point
 
 
@@ -14,6 +15,7 @@ class Line:
         self.p1 = p1
         self.traversed = False
         self.test = False  # FOR TESTING PURPOSES
+        self.polyline = None  # Polyline this segment was merged into, if any (see Grid.mergeTileLines)
     
         if self.p0.x == self.p1.x:  # vertical line has slope None
             self.slope = None
@@ -38,39 +40,37 @@ class Line:
     def yList(self):
         return (self.p0.y, self.p1.y)
 
+    def direction(self):
+        """
+        direction vector from p0 to p1, as used by the Geometry kernel
+        """
+        return (self.p1.x - self.p0.x, self.p1.y - self.p0.y)
+
     def translateOrthogonal(self, offset):
         """
         given an offset distance, orthogonally translate the line. If offset > 0, moves the line generally to the right. If offset < 0,
         moves the line generally to the left. If the line is horizontal, offset > 0 moves it up and offset < 0 moves it down.
         """
-        if self.slope == 0:  # if line is horizontal. easy, just offset y's
-            self.p0.y += offset
-            self.p1.y += offset
-        elif self.slope is None:  # if line is vertical. also easy, just offset x's
-            self.p0.x += offset
-            self.p1.x += offset
-        else:
-            angle = np.arctan2(self.slope, 1)
-            angle += (np.pi if angle < 0 else 0)
-            offset_vector = (offset * np.sin(angle), -offset * np.cos(angle))
-            self.p0.x += offset_vector[0]
-            self.p1.x += offset_vector[0]
-            self.p0.y += offset_vector[1]
-            self.p1.y += offset_vector[1]
+        normal = Geometry.orthogonalNormal(self.direction())
+        offset_vector = (float(offset * normal[0]), float(offset * normal[1]))
+        self.p0.x += offset_vector[0]
+        self.p1.x += offset_vector[0]
+        self.p0.y += offset_vector[1]
+        self.p1.y += offset_vector[1]
 
     def orthogonalDistance(self, point):
         """
         return orthogonal distance from the infinite line represented by this line segment to a given point
         """
-        if self.slope is None:
-            return np.abs(point.x - self.p0.x)  # x-distance
-        elif np.abs(self.slope) < 10**(-5):
-            return np.abs(point.y - self.p0.y)  # y-distance
-        
-        orth_slope = -(1 / self.slope)
-        orth_line = Line(point, Point(point.x + 1, point.y + orth_slope))
-        p2 = Line.intersectionPoint(self, orth_line)
-        return Point.distance(point, p2)
+        return float(Geometry.orthogonalDistance((self.p0.x, self.p0.y), self.direction(), (point.x, point.y)))
+
+    def isBelow(self, other_line):
+        """
+        True if both ends of this segment are strictly below the infinite line represented by other_line (see
+        Geometry.isBelow, which also covers a vertical other_line)
+        """
+        ends = ((self.p0.x, self.p0.y), (self.p1.x, self.p1.y))
+        return bool(np.all(Geometry.isBelow(ends, (other_line.p0.x, other_line.p0.y), other_line.direction())))
 
     def intersectsInfinite(self, other_line):
         """
@@ -79,62 +79,36 @@ class Line:
         NOTE: unlike a lot of the other functions, this one is inclusive, meaning if this line 'pierces' the infinite line,
         it is considered to intersect it. However, colinearity is still not considered intersection
         """
-        int_line = Line.intersectionPoint(self, other_line)
-        xi, yi = int_line.x, int_line.y
-        # print(self, xi, yi)
-
-        if xi is None:  # parallel or colinear
+        t, u, valid = Geometry.intersectLines((self.p0.x, self.p0.y), self.direction(),
+                                              (other_line.p0.x, other_line.p0.y), other_line.direction())
+        if not valid:  # parallel or colinear
             return False
-        
-        if self.slope is None:  # this line segment is vertical (other_line isn't - look at above return case)
-            if min(self.p0.y, self.p1.y) <= yi <= max(self.p0.y, self.p1.y):
-                return True
-            else:
-                return False
-        else:  # this line
-            if min(self.p0.x, self.p1.x) <= xi <= max(self.p0.x, self.p1.x):
-                return True
-            else:
-                return False
+        return -Geometry.EPS <= t <= 1 + Geometry.EPS  # t in [0, 1] is on this segment
 
     @staticmethod
     def intersects(l1, l2):
         """
         return True if the segments l1 and l2 intersect, else return False. Returns False in the case
-        of colinearity
+        of colinearity, and when the intersection is at an endpoint of either segment
         """
-        int_point = Line.intersectionPoint(l1, l2)
-        ix, iy = int_point.x, int_point.y
-        if ix is None:  # lines are parallel or colinear
-            return False
-        
-        x_range = (min(l1.p0.x, l1.p1.x), max(l1.p0.x, l1.p1.x))
-        if l1.slope is None:
-            x_range = (min(l2.p0.x, l2.p1.x), max(l2.p0.x, l2.p1.x))  # l1 is vertical, so use x range from l2
-        
-        if x_range[0] < ix < x_range[1]:  # note: strict equality means the intersection can't occur at an endpoint
-            return True
-        else:
+        t, u, valid = Geometry.intersectLines((l1.p0.x, l1.p0.y), l1.direction(), (l2.p0.x, l2.p0.y), l2.direction())
+        if not valid:  # lines are parallel or colinear
             return False
-        
+        return Geometry.EPS < t < 1 - Geometry.EPS and Geometry.EPS < u < 1 - Geometry.EPS
+
     @staticmethod
     def intersectionPoint(l1, l2):
         """
         get the intersection of the infinite lines corresponding to line segments l1 and l2.
         NOTE: does not check if the line _segments_ actually intersect. For that, use the Line.intersects function.
 
-        in the case that l1 and l2 are colinear or parallel, returns (None, None)
-        """
-        if l1.slope == l2.slope:  # parallel check
-            return None, None
-        elif l1.slope is None:  # l1 is vertical
-            return Point(l1.p0.x, l2.f(l1.p0.x))
-        elif l2.slope is None:  # l2 is vertical
-            return Point(l2.p0.x, l1.f(l2.p0.x))
-        else:
-            x = (l2.p0.y - l1.p0.y + (l1.slope*l1.p0.x) - (l2.slope*l2.p0.x)) / (l1.slope - l2.slope)
-            y = l2.f(x)
-            return Point(x, y)
+        in the case that l1 and l2 are colinear or parallel, returns None
+        """
+        t, u, valid = Geometry.intersectLines((l1.p0.x, l1.p0.y), l1.direction(), (l2.p0.x, l2.p0.y), l2.direction())
+        if not valid:  # parallel check
+            return None
+        dx, dy = l1.direction()
+        return Point(float(l1.p0.x + t*dx), float(l1.p0.y + t*dy))
 
     def __repr__(self):
         return f"({self.p0.x}, {self.p0.y})  -  ({self.p1.x}, {self.p1.y})"
@@ -0,0 +1,507 @@
+"""
+flat, index based view of a Grid's lines for sequence level search.
+
+the aima search in SearchStuff works on [Grid, Line, Point, distance] states and deep copies the grid for every node.
+the searches that work on whole sequences (local search, multi layer planning) use this instead: every tile line gets an
+integer id, and a sequence is a list of (line id, entry end) pairs, entry end 0 meaning the line is entered at p0 and
+left at p1, and 1 the other way around.
+
+moves are priced by a CostModel (default DistanceCostModel). per line print costs and the endpoint to endpoint travel
+cost matrix are computed once, with one vectorized call each, and then only looked up.
+
+printability follows Grid.getPrintableLines exactly, but is tracked with one "next line" counter per tile instead of
+traversed flags, so checking a whole sequence doesn't touch the grid.
+"""
+
+import numpy as np
+from CostModel import DistanceCostModel
+
+
+MATRIX_MAX_LINES = 2000  # above this many lines improveOrder prices moves directly instead of building travelMatrix
+
+
+class LineSet:
+    def __init__(self, grid, cost_model=None):
+        self.grid = grid
+        self.cost_model = DistanceCostModel() if cost_model is None else cost_model
+        self.num_rows = grid.num_rows
+        self.num_columns = grid.num_columns
+        self.lines = []
+        self.tile_of = []  # line id -> (row, column, index in tile)
+        self.tile_start = [[0]*self.num_columns for _ in range(self.num_rows)]  # id of first line in each tile
+        self.tile_count = [[0]*self.num_columns for _ in range(self.num_rows)]
+        for i in range(self.num_rows):
+            for j in range(self.num_columns):
+                self.tile_start[i][j] = len(self.lines)
+                self.tile_count[i][j] = len(grid.tiles[i][j].lines)
+                for k, line in enumerate(grid.tiles[i][j].lines):
+                    self.lines.append(line)
+                    self.tile_of.append((i, j, k))
+
+        self.ends = self._endsOf(self.lines)
+        self.lengths = np.hypot(*(self.ends[:, 1] - self.ends[:, 0]).T) if len(self.lines) > 0 else np.zeros(0)
+        # (upper row, lower row, column) -> {(upper index in tile, lower index in tile): whether the upper line is below
+        # the lower one's extension}. keyed by tile, so updateTiles only drops the pairs of regenerated tiles
+        self._below = {}
+        self._travel_matrix = None
+        self._print_costs = None
+
+    def __len__(self):
+        return len(self.lines)
+
+    @staticmethod
+    def _endsOf(lines):
+        return np.array([[[l.p0.x, l.p0.y], [l.p1.x, l.p1.y]] for l in lines], dtype=float).reshape(-1, 2, 2)
+
+    def lineId(self, row, column, k):
+        return self.tile_start[row][column] + k
+
+    def travelMatrix(self):
+        """
+        (2N, 2N) matrix of travel costs between line endpoints, endpoint 2*id + e being end e of line id. built on first use
+        """
+        if self._travel_matrix is None:
+            points = self.ends.reshape(-1, 2)
+            n = len(points)
+            self._travel_matrix = self.cost_model.travelCosts(np.repeat(points, n, axis=0), np.tile(points, (n, 1))).reshape(n, n)
+        return self._travel_matrix
+
+    def _travelMatrixFrom(self, old_matrix, source):
+        """
+        travel matrix for this line set, copying the entries between lines that are line source[id] in old_matrix and
+        computing only the rows and columns of lines with no source (-1)
+        """
+        kept_ids = np.nonzero(source >= 0)[0]
+        new_ids = np.nonzero(source < 0)[0]
+        kept_points = np.stack((2*kept_ids, 2*kept_ids + 1), axis=1).reshape(-1)
+        source_points = np.stack((2*source[kept_ids], 2*source[kept_ids] + 1), axis=1).reshape(-1)
+        new_points = np.stack((2*new_ids, 2*new_ids + 1), axis=1).reshape(-1)
+        points = self.ends.reshape(-1, 2)
+        n = len(points)
+        m = len(new_points)
+        matrix = np.empty((n, n))
+        matrix[np.ix_(kept_points, kept_points)] = old_matrix[np.ix_(source_points, source_points)]
+        matrix[new_points, :] = self.cost_model.travelCosts(np.repeat(points[new_points], n, axis=0), np.tile(points, (m, 1))).reshape(m, n)
+        matrix[:, new_points] = self.cost_model.travelCosts(np.repeat(points, m, axis=0), np.tile(points[new_points], (n, 1))).reshape(n, m)
+        return matrix
+
+    def reuseTravelMatrix(self, other):
+        """
+        build this line set's travel matrix from other's (eg. the previous layer's), copying the entries between lines of
+        tiles whose lines are identical in both, as they are when both tiles came from the same hatch template. does
+        nothing if other has no matrix, the cost models differ, or this line set is too big for a matrix
+        """
+        if self._travel_matrix is not None or other._travel_matrix is None or other.cost_model is not self.cost_model:
+            return
+        if len(self) > MATRIX_MAX_LINES or self.num_rows != other.num_rows or self.num_columns != other.num_columns:
+            return
+        source = np.full(len(self), -1, dtype=np.int64)
+        for i in range(self.num_rows):
+            for j in range(self.num_columns):
+                start, count = self.tile_start[i][j], self.tile_count[i][j]
+                other_start = other.tile_start[i][j]
+                if count > 0 and count == other.tile_count[i][j] and np.array_equal(self.ends[start:start + count], other.ends[other_start:other_start + count]):
+                    source[start:start + count] = np.arange(other_start, other_start + count)
+        self._travel_matrix = self._travelMatrixFrom(other._travel_matrix, source)
+
+    def printCosts(self):
+        """
+        cost of printing each line, by id
+        """
+        if self._print_costs is None:
+            self._print_costs = np.asarray(self.cost_model.printCosts(self.lengths), dtype=float)
+        return self._print_costs
+
+    def travelFrom(self, point):
+        """
+        (N, 2) travel costs from point (x, y) to each end of each line
+        """
+        points = self.ends.reshape(-1, 2)
+        return self.cost_model.travelCosts(np.tile(np.asarray(point, dtype=float), (len(points), 1)), points).reshape(-1, 2)
+
+    # printability
+    def initialState(self):
+        """
+        per tile counters of how many lines have been printed, all zero
+        """
+        return [[0]*self.num_columns for _ in range(self.num_rows)]
+
+    def _isBelow(self, upper, lower):
+        upper_row, column, upper_k = self.tile_of[upper]
+        lower_row, _, lower_k = self.tile_of[lower]
+        below = self._below.setdefault((upper_row, lower_row, column), {})
+        key = (upper_k, lower_k)
+        if key not in below:
+            below[key] = self.lines[upper].isBelow(self.lines[lower])
+        return below[key]
+
+    def printable(self, state, columns=None):
+        """
+        ids of the lines that can be printed next, in the same order Grid.getPrintableLines gives them. printability
+        only depends on lines in the same column, so columns can restrict the check to some of them
+        """
+        ret_ids = []
+        for j in (range(self.num_columns) if columns is None else columns):
+            lower = None
+            for i in range(self.num_rows):
+                if state[i][j] == self.tile_count[i][j]:  # tile done
+                    continue
+                line_id = self.tile_start[i][j] + state[i][j]
+                if lower is None:
+                    ret_ids.append(line_id)
+                    lower = line_id
+                else:
+                    if self._isBelow(line_id, lower):
+                        ret_ids.append(line_id)
+                    break
+        return ret_ids
+
+    def isPrintable(self, state, line_id):
+        i, j, k = self.tile_of[line_id]
+        if state[i][j] != k:
+            return False
+        lower = None
+        for r in range(i):
+            if state[r][j] != self.tile_count[r][j]:
+                if lower is not None:  # two unfinished tiles below this one
+                    return False
+                lower = self.tile_start[r][j] + state[r][j]
+        return lower is None or self._isBelow(line_id, lower)
+
+    def advance(self, state, line_id):
+        i, j, k = self.tile_of[line_id]
+        state[i][j] += 1
+
+    def isFeasible(self, order, state=None, columns=None):
+        """
+        True if the sequence can be printed in order starting from state (default: nothing printed). if columns is
+        given, only lines in those columns are checked (the rest can't affect them)
+        """
+        state = self.initialState() if state is None else [row[:] for row in state]
+        for line_id, _ in order:
+            if columns is not None and self.tile_of[line_id][1] not in columns:
+                continue
+            if not self.isPrintable(state, line_id):
+                return False
+            self.advance(state, line_id)
+        return True
+
+    # costs
+    def entryPoint(self, line_id, end):
+        return self.ends[line_id, end]
+
+    def exitPoint(self, line_id, end):
+        return self.ends[line_id, 1 - end]
+
+    def travelCost(self, order, start_point=None):
+        """
+        sum of non-extruding travel costs for a sequence. if start_point (x, y) is given, the travel to the first line
+        is included
+        """
+        if len(order) == 0:
+            return 0
+        ids = np.array([a[0] for a in order])
+        ends = np.array([a[1] for a in order])
+        entries = self.ends[ids, ends]
+        exits = self.ends[ids, 1 - ends]
+        cost = np.sum(self.cost_model.travelCosts(exits[:-1], entries[1:]))
+        if start_point is not None:
+            cost += np.sum(self.cost_model.travelCosts(np.asarray(start_point, dtype=float)[None, :], entries[:1]))
+        return float(cost)
+
+    def cost(self, order, start_point=None):
+        """
+        travelCost plus the cost of printing every line in the sequence
+        """
+        return self.travelCost(order, start_point) + float(np.sum(self.printCosts()[[a[0] for a in order]]))
+
+    # building sequences
+    def nearestPrintable(self, state, point):
+        """
+        (line id, entry end) of the printable endpoint cheapest to travel to from point, or None if nothing is printable
+        """
+        candidates = self.printable(state)
+        if len(candidates) == 0:
+            return None
+        entries = self.ends[candidates].reshape(-1, 2)
+        d = self.cost_model.travelCosts(np.tile(np.asarray(point, dtype=float), (len(entries), 1)), entries)
+        c, end = divmod(int(np.argmin(d)), 2)
+        return (candidates[c], end)
+
+    def greedyOrder(self, start_point, priority=None, state=None):
+        """
+        nearest neighbor sequence: from start_point (x, y), repeatedly print whichever printable line has the cheapest
+        endpoint to travel to, entering it at that endpoint. if priority (one number per line id) is given, the printable
+        line with the lowest priority is picked instead and only the entry end is chosen by travel cost.
+        """
+        state = self.initialState() if state is None else [row[:] for row in state]
+        current = np.asarray(start_point, dtype=float)
+        order = []
+        while True:
+            if priority is None:
+                action = self.nearestPrintable(state, current)
+                if action is None:
+                    break
+                line_id, end = action
+            else:
+                candidates = self.printable(state)
+                if len(candidates) == 0:
+                    break
+                line_id = min(candidates, key=lambda c: priority[c])
+                end = int(np.argmin(self.cost_model.travelCosts(np.tile(current, (2, 1)), self.ends[line_id])))
+            order.append((line_id, end))
+            self.advance(state, line_id)
+            current = self.exitPoint(line_id, end)
+        return order
+
+    def improveOrder(self, order, start_point=None, max_passes=None, callback=None, lines=None, window=None, bound=None, target_gap=None, state=None):
+        """
+        local search on a feasible sequence. each pass tries flipping every line's direction and moving every line to
+        every other position, keeping any move that lowers travelCost and leaves the sequence feasible (print costs don't
+        depend on the order, so only travel is compared). stops once a pass finds nothing, or after max_passes.
+        callback: optional function called as callback(order, passes, states) after each line's relocation step, states
+        being the number of candidate sequences evaluated so far. if it returns True the search stops early.
+        lines: optional set of line ids, only these are flipped and moved
+        window: optional max distance (in sequence positions) a line is moved
+        bound, target_gap: a lower bound on cost (see LowerBound.lowerBound) and the optimality gap, (cost - bound) / cost,
+        that is good enough. the search stops as soon as the sequence is within target_gap of the bound. the bound is a
+        relaxation and stays well below the best order on bigger grids (a few % on 2 tiles, ~70% of travel on 8x8), so
+        a target_gap below that is never reached and the search runs its full passes
+        state: per tile counters the sequence starts from, for a sequence of the remaining lines (default nothing printed)
+        returns (order, number of passes)
+        """
+        order = list(order)
+        states = 0
+        stop_travel = -np.inf  # travel cost at which the target gap is reached
+        if target_gap is not None and bound is not None:
+            printing = float(np.sum(self.printCosts()[[a[0] for a in order]]))
+            stop_travel = (np.inf if target_gap >= 1 else bound / (1 - target_gap)) - printing
+        travel = self.travelCost(order, start_point)
+        if travel <= stop_travel:
+            return order, 0
+        matrix = self.travelMatrix() if len(self) <= MATRIX_MAX_LINES else None
+        start = None if start_point is None else np.asarray(start_point, dtype=float)
+        start_costs = None if start_point is None or matrix is None else self.travelFrom(start_point)
+
+        def link(a, b):  # travel from the end of action a to the start of action b, a may be None (start)
+            if a is None:
+                if start is None:
+                    return 0
+                return start_costs[b[0], b[1]] if start_costs is not None else float(self.cost_model.travelCosts(start, self.entryPoint(*b)))
+            if matrix is not None:
+                return matrix[2*a[0] + 1 - a[1], 2*b[0] + b[1]]
+            return float(self.cost_model.travelCosts(self.exitPoint(*a), self.entryPoint(*b)))
+
+        passes = 0
+        improved = True
+        while improved and (max_passes is None or passes < max_passes):
+            improved = False
+            passes += 1
+            n = len(order)
+
+            # direction flips never change feasibility
+            for i in (range(n) if lines is None else [i for i, a in enumerate(order) if a[0] in lines]):
+                prev = order[i - 1] if i > 0 else None
+                nxt = order[i + 1] if i + 1 < n else None
+                flipped = (order[i][0], 1 - order[i][1])
+                states += 1
+                old = link(prev, order[i]) + (link(order[i], nxt) if nxt is not None else 0)
+                new = link(prev, flipped) + (link(flipped, nxt) if nxt is not None else 0)
+                if new < old - 10**(-9):
+                    order[i] = flipped
+                    travel += new - old
+                    improved = True
+
+            # relocate one line
+            prefix, prefix_state = 0, self.initialState() if state is None else [row[:] for row in state]  # counters after order[:prefix]
+            moving = [(p, a) for p, a in enumerate(order) if lines is None or a[0] in lines]
+            for moved, (p, a) in enumerate(moving):
+                i = order.index(a, max(0, p - moved))  # each earlier move shifted a by at most one position
+                prev = order[i - 1] if i > 0 else None
+                nxt = order[i + 1] if i + 1 < n else None
+                removed_gain = link(prev, a) + (link(a, nxt) if nxt is not None else 0) - (link(prev, nxt) if nxt is not None else 0)
+                # a goes to position j (lo <= j <= hi) of the order without it. rest holds positions lo to hi - 1 of that
+                # order, so only the window is copied
+                lo = 0 if window is None else max(0, i - window)
+                hi = n - 1 if window is None else min(n - 1, i + window)
+                rest = order[lo:i] + order[i + 1:hi + 1]
+                best_j, best_delta = None, -10**(-9)
+                # moving a line can only break printability within its column, and only between its old and new
+                # positions (after both, the same lines are printed as before), so only that stretch is checked,
+                # starting from the counters after order[:lo]. lo moves little from one line to the next, so those are
+                # kept by stepping prefix forward or back instead of recounting from the start
+                column = {self.tile_of[a[0]][1]}
+                while prefix < lo:
+                    self.advance(prefix_state, order[prefix][0])
+                    prefix += 1
+                while prefix > lo:
+                    prefix -= 1
+                    r, c, _ = self.tile_of[order[prefix][0]]
+                    prefix_state[r][c] -= 1
+                for j in range(lo, hi + 1):
+                    if j == i:
+                        continue
+                    before = rest[j - lo - 1] if j > lo else (order[lo - 1] if lo > 0 else None)
+                    after = rest[j - lo] if j < hi else (order[hi + 1] if hi + 1 < n else None)
+                    states += 1
+                    added = link(before, a) + (link(a, after) if after is not None else 0) - (link(before, after) if after is not None else 0)
+                    delta = added - removed_gain
+                    if delta < best_delta:
+                        if self.isFeasible(rest[:j - lo] + [a] + rest[j - lo:max(i, j) - lo], prefix_state, column):
+                            best_j, best_delta = j, delta
+                if best_j is not None:  # both positions are >= lo, so order[:prefix] is unchanged
+                    order.pop(i)
+                    order.insert(best_j, a)
+                    travel += best_delta
+                    improved = True
+                if callback is not None and callback(order, passes, states):
+                    return order, passes
+                if travel <= stop_travel:
+                    return order, passes
+
+        return order, passes
+
+    def toActions(self, order):
+        """
+        convert a sequence to the [Line, Point] actions ToolpathProblem uses
+        """
+        return [[self.lines[line_id], self.lines[line_id].p0 if end == 0 else self.lines[line_id].p1] for line_id, end in order]
+
+
+    # incremental updates
+    def updateTiles(self, tiles):
+        """
+        patch this line set after the given (row, column) tiles had their lines regenerated (Grid.regenDirtyTiles).
+        lines of other tiles keep their endpoints, precedence and cost data, only shifted to their new ids; data that
+        involves a regenerated line (including precedence with the tiles above and below it) is dropped or recomputed.
+        returns (remap, removed): remap[old id] is the new id, or -1 for lines of regenerated tiles, and removed maps
+        each of those old ids to its (row, column)
+        """
+        tiles = sorted(set(tiles))  # row major, ie. id order
+        removed_tiles = set(tiles)
+        old_n = len(self.lines)
+        remap = np.full(old_n, -1, dtype=np.int64)
+        lines, tile_of, ends = [], [], []
+        new_ids = []
+        removed = {}
+        run_start = 0  # old id where the current run of untouched lines starts
+        shift = 0
+        for i, j in tiles:
+            start, count = self.tile_start[i][j], self.tile_count[i][j]
+            for old_id in range(start, start + count):
+                removed[old_id] = (i, j)
+            lines += self.lines[run_start:start]
+            tile_of += self.tile_of[run_start:start]
+            ends.append(self.ends[run_start:start])
+            remap[run_start:start] = np.arange(run_start, start) + shift
+
+            tile_lines = self.grid.tiles[i][j].lines
+            new_ids += range(start + shift, start + shift + len(tile_lines))
+            lines += tile_lines
+            tile_of += [(i, j, k) for k in range(len(tile_lines))]
+            ends.append(self._endsOf(tile_lines))
+            shift += len(tile_lines) - count
+            self.tile_count[i][j] = len(tile_lines)
+            run_start = start + count
+        lines += self.lines[run_start:]
+        tile_of += self.tile_of[run_start:]
+        ends.append(self.ends[run_start:])
+        remap[run_start:] = np.arange(run_start, old_n) + shift
+
+        self.lines = lines
+        self.tile_of = tile_of
+        self.ends = np.concatenate(ends).reshape(-1, 2, 2)
+        self.lengths = np.hypot(*(self.ends[:, 1] - self.ends[:, 0]).T) if len(self.lines) > 0 else np.zeros(0)
+        counts = np.array(self.tile_count, dtype=np.int64).reshape(-1)
+        self.tile_start = (np.cumsum(counts) - counts).reshape(self.num_rows, self.num_columns).tolist()
+
+        for key in [key for key in self._below if (key[0], key[2]) in removed_tiles or (key[1], key[2]) in removed_tiles]:
+            del self._below[key]
+        kept = remap >= 0
+        new_ids = np.array(new_ids, dtype=np.int64)
+        if self._print_costs is not None:
+            print_costs = np.empty(len(self.lines))
+            print_costs[remap[kept]] = self._print_costs[kept]
+            print_costs[new_ids] = self.cost_model.printCosts(self.lengths[new_ids])
+            self._print_costs = print_costs
+        if self._travel_matrix is not None:
+            source = np.full(len(self.lines), -1, dtype=np.int64)
+            source[remap[kept]] = np.nonzero(kept)[0]
+            self._travel_matrix = self._travelMatrixFrom(self._travel_matrix, source)
+        return remap, removed
+
+    def repairOrder(self, order, tiles, remap, removed, start_point=None, window=20):
+        """
+        repair a sequence planned before updateTiles instead of solving again. tiles, remap and removed are what was
+        passed to and returned by updateTiles. lines of untouched tiles keep their place; a regenerated tile's new lines
+        are spread, in tile order, over the positions its old lines held (new line k where old line k * old / new was),
+        so a tile that was printed interleaved with its neighbours stays interleaved (tiles that had no lines go at the
+        end). any column that is no longer printable in that order is reordered within the positions its lines already
+        hold, and the lines of the regenerated tiles' columns then get a windowed local search. up to MATRIX_MAX_LINES
+        lines, where greedyOrder is cheap, the cheaper of that and greedyOrder is returned; above it a greedy order is
+        as slow as solving again, which is what repairing avoids
+        """
+        def entered(line_id, point):  # line entered at the end nearest the previous exit
+            if point is None:
+                return (line_id, 0)
+            return (line_id, int(np.argmin(self.cost_model.travelCosts(np.tile(point, (2, 1)), self.ends[line_id]))))
+
+        def tileIds(tile):
+            return range(self.tile_start[tile[0]][tile[1]], self.tile_start[tile[0]][tile[1]] + self.tile_count[tile[0]][tile[1]])
+
+        tiles = set(tiles)
+        start = None if start_point is None else np.asarray(start_point, dtype=float)
+        old_ids = np.array([line_id for line_id, _ in order], dtype=np.int64).reshape(-1)
+        mapped = list(zip(remap[old_ids].tolist(), [end for _, end in order]))
+        old_positions = {}  # regenerated tile -> positions of its old lines
+        for p in np.nonzero(remap[old_ids] < 0)[0].tolist():
+            old_positions.setdefault(removed[int(old_ids[p])], []).append(p)
+        anchored = {}  # old position -> new lines that go there
+        for tile, positions in old_positions.items():
+            ids = tileIds(tile)
+            for k, line_id in enumerate(ids):
+                anchored.setdefault(positions[k * len(positions) // len(ids)], []).append(line_id)
+        new_order = []
+        for p, action in enumerate(mapped):
+            if action[0] >= 0:
+                new_order.append(action)
+            for line_id in anchored.get(p, ()):
+                new_order.append(entered(line_id, self.exitPoint(*new_order[-1]) if len(new_order) > 0 else start))
+        for tile in sorted(tiles - set(old_positions)):
+            for line_id in tileIds(tile):
+                new_order.append(entered(line_id, self.exitPoint(*new_order[-1]) if len(new_order) > 0 else start))
+
+        for j in sorted(set(tile[1] for tile in tiles)):
+            if self.isFeasible(new_order, columns={j}):
+                continue
+            # reorder this column's lines within their own positions, keeping their current order where printable
+            positions = [p for p, (line_id, _) in enumerate(new_order) if self.tile_of[line_id][1] == j]
+            ends = {new_order[p][0]: new_order[p][1] for p in positions}
+            priority = {new_order[p][0]: n for n, p in enumerate(positions)}
+            state = self.initialState()
+            for p in positions:
+                line_id = min(self.printable(state, [j]), key=lambda c: priority[c])
+                new_order[p] = (line_id, ends[line_id])
+                self.advance(state, line_id)
+
+        column_ids = set()  # the column's other lines have to make room around the new ones
+        for j in set(tile[1] for tile in tiles):
+            for i in range(self.num_rows):
+                column_ids.update(tileIds((i, j)))
+        new_order = self.improveOrder(new_order, start_point, 2, lines=column_ids, window=window)[0]
+        if len(self.lines) > MATRIX_MAX_LINES:
+            return new_order
+        greedy = self.greedyOrder(start_point)
+        return new_order if self.cost(new_order, start_point) <= self.cost(greedy, start_point) else greedy
+
+if __name__ == "__main__":
+    from Grid import Grid
+
+    grid = Grid(3, 3, -45, 0, 1, .1)
+    grid.randomGenAngles(-45, 45)
+    grid.genTileLines()
+    line_set = LineSet(grid)
+    order = line_set.greedyOrder((0, 0))
+    print(len(order), line_set.isFeasible(order), line_set.travelCost(order))
+    order, passes = line_set.improveOrder(order, (0, 0))
+    print(passes, line_set.isFeasible(order), line_set.travelCost(order))
@@ -0,0 +1,124 @@
+"""
+lower bounds on the cost of any feasible sequence of a LineSet, and the optimality gap they give a solution.
+
+every line is entered at one end and left at the other, and between lines the nozzle travels from an exit to an entry.
+so in any sequence each line endpoint has exactly one travel move touching it, the entry end the move in from the line
+before (or from the start point) and the exit end the move out to the line after (or the end of the sequence): the
+travel moves are a perfect matching of the endpoints plus a start and an end node, and the cheapest such matching
+can't cost more than the best sequence. the relaxation drops subtours, but keeps end consistency (a line can't be
+entered and left at the same end) and the precedence that rules out moves outright:
+    - within a tile lines are printed in order, so a line only meets lines k - 1 and k + 1 of its own tile
+    - the start point only meets lines that are printable from the initial state
+the matching is relaxed once more to fit scipy's linear_sum_assignment: on the symmetric (2N + 2, 2N + 2) endpoint
+matrix (from LineSet.travelMatrix) every matching is an assignment of twice its cost, so half the cheapest assignment is
+still a bound. it is much tighter than matching whole lines, which lets a line be entered and left at its cheaper end.
+
+above MATRIX_MAX_LINES lines the dense matrix isn't built, and the bound falls back to every line's cheapest incoming
+travel: the nearest endpoint of another line (scipy cKDTree) or the start point. that fallback assumes travel cost only
+grows with distance, which holds for both cost models in CostModel.
+"""
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial import cKDTree
+from LineSet import MATRIX_MAX_LINES
+
+
+def _startCosts(line_set, start_point):
+    """
+    (N,) cheapest travel from start_point to each line, 0 for every line if there is no start point
+    """
+    if start_point is None:
+        return np.zeros(len(line_set))
+    return line_set.travelFrom(start_point).min(axis=1)
+
+
+def assignmentBound(line_set, start_point=None):
+    """
+    lower bound on the travel cost of any feasible sequence, from the endpoint matching relaxation
+    """
+    n = len(line_set)
+    if n == 0:
+        return 0.0
+    matrix = line_set.travelMatrix()
+    links = np.minimum(matrix, matrix.T)  # a move can be made in either direction
+    owner = np.repeat(np.arange(n), 2)
+    tile = np.array([i * line_set.num_columns + j for i, j, _ in line_set.tile_of])[owner]
+    k = np.array([k for _, _, k in line_set.tile_of])[owner]
+    forbidden = (tile[:, None] == tile[None, :]) & (np.abs(k[:, None] - k[None, :]) != 1)  # includes the line's own ends
+
+    # node 2n is the start point, 2n + 1 the end of the sequence
+    costs = np.full((2*n + 2, 2*n + 2), np.inf)
+    costs[:2*n, :2*n] = np.where(forbidden, np.inf, links)
+    first = line_set.printable(line_set.initialState())
+    start = np.full((n, 2), np.inf)
+    start[first] = np.zeros((len(first), 2)) if start_point is None else line_set.travelFrom(start_point)[first]
+    costs[2*n, :2*n] = costs[:2*n, 2*n] = start.reshape(-1)
+    costs[2*n + 1, :2*n] = costs[:2*n, 2*n + 1] = 0
+    rows, columns = linear_sum_assignment(costs)
+    return float(costs[rows, columns].sum()) / 2
+
+
+def nearestBound(line_set, start_point=None):
+    """
+    weaker, matrix free lower bound on travel: the sum over lines of their cheapest incoming travel. without a start
+    point the first line has no incoming travel, so the largest term is dropped
+    """
+    n = len(line_set)
+    if n == 0:
+        return 0.0
+    points = line_set.ends.reshape(-1, 2)
+    owner = np.repeat(np.arange(n), 2)
+    # the nearest two points can be the line's own ends, the third can't
+    _, nearest = cKDTree(points).query(points, k=min(3, len(points)))
+    nearest = np.atleast_2d(nearest.reshape(len(points), -1))
+    other = owner[nearest] != owner[:, None]
+    if not np.any(other):  # a single line
+        incoming = np.full(n, np.inf)
+    else:
+        pick = nearest[np.arange(len(points)), np.argmax(other, axis=1)]
+        incoming = line_set.cost_model.travelCosts(points[pick], points).reshape(n, 2).min(axis=1)
+    if start_point is not None:
+        return float(np.sum(np.minimum(incoming, _startCosts(line_set, start_point))))
+    incoming[np.argmax(incoming)] = 0
+    return float(np.sum(incoming))
+
+
+def lowerBound(line_set, start_point=None):
+    """
+    lower bound on LineSet.cost (travel plus printing) of any feasible sequence starting from start_point (x, y). uses
+    the assignment relaxation up to MATRIX_MAX_LINES lines and nearestBound above
+    """
+    if len(line_set) <= MATRIX_MAX_LINES:
+        travel = assignmentBound(line_set, start_point)
+    else:
+        travel = nearestBound(line_set, start_point)
+    return travel + float(np.sum(line_set.printCosts()))
+
+
+def optimalityGap(cost, bound):
+    """
+    how far cost can be from optimal, as a fraction of cost: (cost - bound) / cost. 0 means provably optimal
+    """
+    if cost <= 0:
+        return 0.0
+    return max(0.0, (cost - bound) / cost)
+
+
+if __name__ == "__main__":
+    import time
+    from Grid import Grid
+    from LineSet import LineSet
+
+    for size in (2, 4, 8):
+        grid = Grid(size, size, -45, 0, 1, .1)
+        grid.randomGenAngles(-45, 45)
+        grid.genTileLines()
+        line_set = LineSet(grid)
+        t = time.time()
+        bound = lowerBound(line_set, (0, 0))
+        dt = time.time() - t
+        order, _ = line_set.improveOrder(line_set.greedyOrder((0, 0)), (0, 0))
+        cost = line_set.cost(order, (0, 0))
+        print(f"{size}x{size}, {len(line_set)} lines: cost {round(cost, 4)}, bound {round(bound, 4)} ({round(dt, 3)} s), "
+              f"nearest bound {round(nearestBound(line_set, (0, 0)), 4)}, gap {round(100 * optimalityGap(cost, bound), 1)}%")
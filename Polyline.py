@@ -0,0 +1,147 @@
+from Line import Line
+from Point import Point
+
+
+class Polyline:
+    """
+    a chain of line segments whose neighboring endpoints coincide. printed as a single unit, so it stands in for a Line
+    anywhere the search or the plotting code only needs p0, p1, traversed, length(), xList() and yList()
+    """
+    def __init__(self, lines, points, claim_lines=True):
+        """
+        lines: segments in print order
+        points: len(lines) + 1 points, points[i] and points[i + 1] being the ends of lines[i]
+        claim_lines: set each segment's polyline to this one. False for the temporary pieces from untraversedRuns
+        """
+        self.lines = lines
+        self.points = points
+        if claim_lines:
+            for line in self.lines:
+                line.polyline = self
+
+    @property
+    def p0(self):
+        return self.points[0]
+
+    @property
+    def p1(self):
+        return self.points[-1]
+
+    @property
+    def traversed(self):
+        for line in self.lines:
+            if not line.traversed:
+                return False
+        return True
+
+    @traversed.setter
+    def traversed(self, value):
+        for line in self.lines:
+            line.traversed = value
+
+    def untraversedRuns(self):
+        """
+        the stretches of this chain that haven't been printed yet, as polylines. just [self] if none of it has, but once
+        a segment has been printed on its own the rest can only be printed piece by piece
+        """
+        if not any(line.traversed for line in self.lines):
+            return [self]
+        runs = []
+        start = None
+        for k in range(len(self.lines) + 1):
+            if k < len(self.lines) and not self.lines[k].traversed:
+                if start is None:
+                    start = k
+            elif start is not None:
+                runs.append(Polyline(self.lines[start:k], self.points[start:k + 1], claim_lines=False))
+                start = None
+        return runs
+
+    def length(self):
+        return sum(line.length() for line in self.lines)
+
+    def xList(self):
+        return tuple(point.x for point in self.points)
+
+    def yList(self):
+        return tuple(point.y for point in self.points)
+
+    def __repr__(self):
+        return " - ".join(str(point) for point in self.points)
+
+    def __eq__(self, other):
+        return self.p0 == other.p0 and self.p1 == other.p1
+
+    @staticmethod
+    def mergeLines(lines, tol=10**(-5)):
+        """
+        fuse line segments whose endpoints are within tol of each other into polylines. every line ends up in exactly
+        one returned polyline (lines with no partner become single segment polylines).
+        endpoints are bucketed into a hash grid with cell size tol, so finding the partners of an endpoint only means
+        looking at the 3x3 block of cells around it. an endpoint shared by more than two segments is ambiguous and is
+        left as a break in the chain.
+        """
+        def cell(point):
+            return (int(point.x // tol), int(point.y // tol))
+
+        buckets = {}  # cell -> list of (line index, end index) with that endpoint in the cell
+        for i in range(len(lines)):
+            for end, point in enumerate((lines[i].p0, lines[i].p1)):
+                buckets.setdefault(cell(point), []).append((i, end))
+
+        def endPoint(i, end):
+            return lines[i].p0 if end == 0 else lines[i].p1
+
+        # partner[(i, end)] is the single other segment end touching this one, if there is exactly one
+        partner = {}
+        for i in range(len(lines)):
+            for end in (0, 1):
+                point = endPoint(i, end)
+                cx, cy = cell(point)
+                touching = []
+                for dx in (-1, 0, 1):
+                    for dy in (-1, 0, 1):
+                        for key in buckets.get((cx + dx, cy + dy), ()):
+                            other = endPoint(*key)
+                            if key[0] != i and abs(other.x - point.x) < tol and abs(other.y - point.y) < tol:  # not Point.__eq__, its tolerance is fixed
+                                touching.append(key)
+                if len(touching) == 1:
+                    partner[(i, end)] = touching[0]
+
+        # walk each chain starting from a free end (or anywhere, for closed loops)
+        used = [False] * len(lines)
+        polylines = []
+
+        def walk(i, start_end):
+            chain_lines = []
+            chain_points = [endPoint(i, start_end)]
+            end = start_end
+            while i is not None and not used[i]:
+                used[i] = True
+                chain_lines.append(lines[i])
+                chain_points.append(endPoint(i, 1 - end))
+                nxt = partner.get((i, 1 - end))
+                if nxt is None or partner.get(nxt) != (i, 1 - end):
+                    i = None
+                else:
+                    i, end = nxt
+            return Polyline(chain_lines, chain_points)
+
+        for i in range(len(lines)):
+            if used[i]:
+                continue
+            if (i, 0) not in partner:
+                polylines.append(walk(i, 0))
+            elif (i, 1) not in partner:
+                polylines.append(walk(i, 1))
+        for i in range(len(lines)):  # whatever is left is part of a closed loop
+            if not used[i]:
+                polylines.append(walk(i, 0))
+
+        return polylines
+
+
+if __name__ == "__main__":
+    lines = [Line(Point(0, 0), Point(1, 1)), Line(Point(2, 1), Point(1, 1 + 10**(-6))), Line(Point(5, 5), Point(6, 6))]
+    for polyline in Polyline.mergeLines(lines):
+        print(polyline)
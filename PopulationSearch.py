@@ -0,0 +1,209 @@
+"""
+batched evaluation of many candidate sequences at once, and a cross entropy solver built on it.
+
+a population is a (P, N) array of line ids (each row a permutation of the LineSet's ids, in print order) and a matching
+(P, N) array of entry end bits (see LineSet). instead of walking one sequence in Python, every function here steps
+through the N positions once and handles all P candidates with array operations:
+    - costs: travel cost of every candidate in one vectorized cost model call
+    - feasible: precedence check of every candidate (same rules as LineSet.isPrintable)
+    - bestEnds: optimal entry ends for every candidate's line order (2 state dynamic program)
+    - decode: turn per line priorities into feasible orders, so the solver never produces unprintable candidates
+
+crossEntropySolve samples priorities around a mean that starts at a greedy order, keeps the best fraction, and moves the
+mean and spread toward them.
+"""
+
+import numpy as np
+import Geometry
+from LowerBound import lowerBound, optimalityGap
+
+
+class BatchEvaluator:
+    def __init__(self, line_set, start_point=None):
+        self.line_set = line_set
+        self.start_point = None if start_point is None else np.asarray(start_point, dtype=float)
+        self.ends = line_set.ends
+        self.n = len(line_set)
+        self.count = np.array(line_set.tile_count, dtype=np.int64).reshape(line_set.num_rows, line_set.num_columns)
+        self.start = np.array(line_set.tile_start, dtype=np.int64).reshape(line_set.num_rows, line_set.num_columns)
+        tile_of = np.array(line_set.tile_of, dtype=np.int64).reshape(-1, 3)
+        self.row_of = tile_of[:, 0]
+        self.column_of = tile_of[:, 1]
+        self.print_cost = float(np.sum(line_set.printCosts()))
+
+    # precedence
+    def _below(self, upper, lower):
+        """
+        LineSet._isBelow for arrays of ids: both ends of upper below lower's extension (Geometry.isBelow)
+        """
+        u = self.ends[upper]
+        m = self.ends[lower]
+        return np.all(Geometry.isBelow(u, m[..., None, 0, :], (m[..., 1, :] - m[..., 0, :])[..., None, :]), axis=-1)
+
+    def _printable(self, counters):
+        """
+        printable lines for a (P, rows, columns) array of per tile counters. returns (ids, valid), both (P, 2*columns):
+        per column the next line of the lowest unfinished tile, and of the one above it if it's below the first
+        """
+        rows = np.arange(self.count.shape[0])[None, :, None]
+        columns = np.arange(self.count.shape[1])[None, :]
+        unfinished = counters < self.count[None]
+        r1 = np.argmax(unfinished, axis=1)
+        has1 = unfinished.any(axis=1)
+        above = unfinished & (rows > r1[:, None, :])
+        r2 = np.argmax(above, axis=1)
+        has2 = above.any(axis=1)
+        c1 = np.take_along_axis(counters, r1[:, None, :], axis=1)[:, 0, :]
+        c2 = np.take_along_axis(counters, r2[:, None, :], axis=1)[:, 0, :]
+        id1 = np.minimum(self.start[r1, columns] + c1, self.n - 1)
+        id2 = np.minimum(self.start[r2, columns] + c2, self.n - 1)
+        has2 &= has1 & self._below(id2, id1)
+        return np.concatenate((id1, id2), axis=1), np.concatenate((has1, has2), axis=1)
+
+    def feasible(self, ids):
+        """
+        (P,) bool, True where the row of ids is a permutation of all lines that can be printed in that order
+        """
+        ids = np.atleast_2d(ids)
+        p = len(ids)
+        ok = np.all(np.sort(ids, axis=1) == np.arange(self.n)[None, :], axis=1)
+        counters = np.zeros((p,) + self.count.shape, dtype=np.int64)
+        everyone = np.arange(p)
+        for t in range(self.n):
+            line = np.clip(ids[:, t], 0, self.n - 1)
+            candidates, valid = self._printable(counters)
+            ok &= np.any((candidates == line[:, None]) & valid, axis=1)
+            counters[everyone, self.row_of[line], self.column_of[line]] += 1
+        return ok
+
+    # costs
+    def costs(self, ids, ends):
+        """
+        (P,) total cost (travel + printing) of each candidate, travel priced in a single cost model call
+        """
+        ids = np.atleast_2d(ids)
+        ends = np.atleast_2d(ends)
+        entries = self.ends[ids, ends]  # (P, N, 2)
+        exits = self.ends[ids, 1 - ends]
+        if self.start_point is not None:
+            exits = np.concatenate((np.broadcast_to(self.start_point, (len(ids), 1, 2)), exits), axis=1)
+        else:
+            entries = entries[:, 1:]
+        travel = self.line_set.cost_model.travelCosts(exits[:, :entries.shape[1]], entries)
+        return np.sum(travel, axis=1) + self.print_cost
+
+    def bestEnds(self, ids):
+        """
+        optimal entry ends for each candidate's line order. returns (ends, costs), (P, N) and (P,)
+        """
+        ids = np.atleast_2d(ids)
+        p = len(ids)
+        model = self.line_set.cost_model
+        pts = self.ends[ids]  # (P, N, end, xy)
+        if self.start_point is None:
+            best = np.zeros((p, 2))
+        else:
+            best = model.travelCosts(np.broadcast_to(self.start_point, (p, 2, 2)), pts[:, 0])
+        choice = np.zeros((p, self.n, 2), dtype=np.int64)  # choice[:, t, e]: entry end at t - 1 on the best path into end e at t
+        for t in range(1, self.n):
+            # exit of line t - 1 entered at e' is its end 1 - e'
+            travel = model.travelCosts(pts[:, t - 1, ::-1][:, :, None, :], pts[:, t][:, None, :, :])  # (P, e', e)
+            total = best[:, :, None] + travel
+            choice[:, t] = np.argmin(total, axis=1)
+            best = np.min(total, axis=1)
+        ends = np.zeros((p, self.n), dtype=np.int64)
+        ends[:, -1] = np.argmin(best, axis=1)
+        for t in range(self.n - 1, 0, -1):
+            ends[:, t - 1] = choice[np.arange(p), t, ends[:, t]]
+        return ends, np.min(best, axis=1) + self.print_cost
+
+    def decode(self, priorities):
+        """
+        feasible orders from (P, N) per line priorities: at every step each candidate prints the printable line with the
+        lowest priority. returns (P, N) ids
+        """
+        priorities = np.atleast_2d(priorities)
+        p = len(priorities)
+        counters = np.zeros((p,) + self.count.shape, dtype=np.int64)
+        ids = np.zeros((p, self.n), dtype=np.int64)
+        everyone = np.arange(p)
+        for t in range(self.n):
+            candidates, valid = self._printable(counters)
+            keys = np.where(valid, np.take_along_axis(priorities, candidates, axis=1), np.inf)
+            line = candidates[everyone, np.argmin(keys, axis=1)]
+            ids[:, t] = line
+            counters[everyone, self.row_of[line], self.column_of[line]] += 1
+        return ids
+
+
+def crossEntropySolve(line_set, start_point=None, population=500, elite_fraction=.1, iterations=50, smoothing=.7, seed_order=None, rng=None, target_gap=None, callback=None):
+    """
+    cross entropy search over line priorities. seed_order (default: LineSet.greedyOrder) sets the initial mean, so the
+    search starts from that order's quality and can only improve on it. returns (order, cost, history), order being a
+    list of (line id, entry end) and history the best cost after each iteration
+    target_gap: stop once the best cost is within this optimality gap of LowerBound.lowerBound
+    callback: optional function called as callback(best_cost, gap, iteration) after each iteration. if it returns True
+    the search stops early
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    evaluator = BatchEvaluator(line_set, start_point)
+    n = len(line_set)
+    if seed_order is None:
+        seed_order = line_set.greedyOrder((0, 0) if start_point is None else start_point)
+
+    mean = np.zeros(n)
+    mean[[line_id for line_id, _ in seed_order]] = np.arange(n) / n
+    std = np.full(n, 3 / n)
+    best_ids = np.array([[line_id for line_id, _ in seed_order]])
+    best_ends, best_cost = evaluator.bestEnds(best_ids)
+    best_ends, best_cost = best_ends[0], best_cost[0]
+    history = []
+    n_elite = max(2, int(population * elite_fraction))
+    bound = None if target_gap is None and callback is None else lowerBound(line_set, start_point)
+
+    for iteration in range(iterations):
+        if target_gap is not None and optimalityGap(best_cost, bound) <= target_gap:
+            break
+        samples = mean + std * rng.standard_normal((population, n))
+        samples[0] = mean  # the mean itself is always a candidate
+        ids = evaluator.decode(samples)
+        ends, costs = evaluator.bestEnds(ids)
+        elite = np.argsort(costs)[:n_elite]
+        if costs[elite[0]] < best_cost:
+            best_cost = costs[elite[0]]
+            best_ids, best_ends = ids[elite[0]:elite[0] + 1], ends[elite[0]]
+        history.append(best_cost)
+
+        # position of every line in each elite order, normalized like the priorities
+        ranks = np.empty((n_elite, n))
+        ranks[np.arange(n_elite)[:, None], ids[elite]] = np.arange(n)[None, :] / n
+        mean = smoothing * ranks.mean(axis=0) + (1 - smoothing) * mean
+        std = np.maximum(smoothing * ranks.std(axis=0) + (1 - smoothing) * std, .5 / n)
+        if callback is not None and callback(best_cost, optimalityGap(best_cost, bound), iteration):
+            break
+
+    order = [(int(line_id), int(end)) for line_id, end in zip(best_ids[0], best_ends)]
+    return order, float(best_cost), history
+
+
+if __name__ == "__main__":
+    import time
+    from Grid import Grid
+    from LineSet import LineSet
+
+    grid = Grid(3, 3, -45, 0, 1, .1)
+    grid.randomGenAngles(-45, 45)
+    grid.genTileLines()
+    line_set = LineSet(grid)
+    evaluator = BatchEvaluator(line_set, (0, 0))
+
+    greedy = line_set.greedyOrder((0, 0))
+    print("greedy:", round(line_set.cost(greedy, (0, 0)), 4))
+    def report(cost, gap, iteration):
+        print(f"iteration {iteration}: {round(cost, 4)}, gap {round(100 * gap, 1)}%")
+
+    t = time.time()
+    order, cost, history = crossEntropySolve(line_set, (0, 0), iterations=30, callback=report)
+    dt = time.time() - t
+    print("cross entropy:", round(cost, 4), round(line_set.cost(order, (0, 0)), 4), line_set.isFeasible(order))
+    print(f"{round(30 * 500 / dt)} candidates per second")
@@ -1,20 +1,48 @@
 import copy
 import numpy as np
 import sys
+from scipy.spatial import cKDTree
 sys.path.append("aima-python")
 
+from CostModel import DistanceCostModel
 from Grid import Grid, showGridLines
 from Line import Line
+from LineSet import LineSet
+from LowerBound import lowerBound, optimalityGap
 from Point import Point
 from search import *
 
+REFERENCE_PASSES = 2  # improveOrder limits for the default miss tracking reference
+REFERENCE_WINDOW = 20
+
 
 class ToolpathProblem(Problem):
     """
     state representation:
-    [grid: Grid, current_line: Line, current_point: Point, traversal_distance: distance of total non-extrude movements, needed for local searches]
+    [grid: Grid, current_line: Line, current_point: Point, traversal_distance: cost of the last non-extrude movement, needed for local searches]
+
+    cost_model: CostModel used to price moves. defaults to DistanceCostModel, ie. straight line travel distance
+    candidates: if given, actions only offers the candidates nearest printable endpoints to the current point, plus
+        whatever escape(state, actions) picks (indices into the full action list, default leftmostEscape)
+    reference: sequence of (line id, entry end) (see LineSet, ids are positions in grid.getLines()) that pruning is
+        checked against: the move it would make next is the printable line that comes first in it. passing one turns
+        on miss tracking (pruning_stats["missed_best"])
+    track_misses: track misses without a reference: one is solved from the first state that gets pruned, greedy start
+        + a short windowed improveOrder. off by default, the solve costs more than pruning saves on one search
     """
 
+    def __init__(self, initial, cost_model=None, candidates=None, escape=None, reference=None, track_misses=False):
+        super().__init__(initial)
+        self.cost_model = DistanceCostModel() if cost_model is None else cost_model
+        self.candidates = candidates
+        self.escape = leftmostEscape if escape is None else escape
+        self.reference = reference
+        self.track_misses = track_misses or reference is not None
+        self._reference_positions = None  # line id -> (position in reference, entry end)
+        # calls: pruned actions calls, offered/total: actions kept/available, missed_best: calls where the reference
+        # solution's next move was pruned away
+        self.pruning_stats = {"calls": 0, "offered": 0, "total": 0, "missed_best": 0}
+
     def actions(self, state):
         """
         return a list of possible points to traverse to
@@ -27,7 +55,73 @@ class ToolpathProblem(Problem):
             actions.append([line, line.p0])
             actions.append([line, line.p1])
 
-        return actions
+        if self.candidates is None or len(actions) <= self.candidates or state[2] is None:
+            return actions
+        return self._pruneActions(state, actions)
+
+    def _pruneActions(self, state, actions):
+        """
+        keep the self.candidates actions whose start point is nearest the current point (KD tree over the printable
+        endpoints) plus the escape set, and if misses are tracked record whether the reference solution's next move
+        survived
+        """
+        current = (state[2].x, state[2].y)
+        points = np.array([(action[1].x, action[1].y) for action in actions])
+        _, nearest = cKDTree(points).query(current, k=self.candidates)
+        keep = set(np.atleast_1d(nearest).tolist())
+        keep.update(self.escape(state, actions))
+
+        self.pruning_stats["calls"] += 1
+        self.pruning_stats["offered"] += len(keep)
+        self.pruning_stats["total"] += len(actions)
+        if self.track_misses and self._referenceMove(state, actions) not in keep:
+            self.pruning_stats["missed_best"] += 1
+        return [actions[i] for i in sorted(keep)]
+
+    def _referenceMove(self, state, actions):
+        """
+        index of the action the reference solution takes next: the one whose line comes first in it, entered at the
+        reference's entry end. the nearest move is always among the nearest candidates, so checking pruning against it
+        would say nothing; the reference is what an unpruned search ends up printing
+        """
+        grid = state[0]
+        if self.reference is None:
+            # solve the rest of the grid from this state without pruning, kept short: window and pass limits
+            line_set = LineSet(grid, self.cost_model)
+            counters = line_set.initialState()
+            for line_id, line in enumerate(line_set.lines):
+                if line.traversed:
+                    line_set.advance(counters, line_id)
+            current = (state[2].x, state[2].y)
+            order = line_set.greedyOrder(current, state=counters)
+            self.reference, _ = line_set.improveOrder(order, current, REFERENCE_PASSES, window=REFERENCE_WINDOW, state=counters)
+        if self._reference_positions is None:
+            self._reference_positions = {line_id: (p, end) for p, (line_id, end) in enumerate(self.reference)}
+
+        lines = grid.getLines()
+        ids = {id(line): line_id for line_id, line in enumerate(lines)}
+        best, best_key = None, None
+        for n, (line, point) in enumerate(actions):
+            segments = [line] if isinstance(line, Line) else line.lines  # a polyline comes as early as its first segment
+            position, line_id = min((self._reference_positions.get(ids[id(seg)], (np.inf, 0))[0], ids[id(seg)]) for seg in segments)
+            end = self._reference_positions.get(line_id, (np.inf, 0))[1]
+            entry = lines[line_id].p0 if end == 0 else lines[line_id].p1
+            key = (position, 0 if point == entry else 1)
+            if best_key is None or key < best_key:
+                best, best_key = n, key
+        return best
+
+    def pruningReport(self):
+        """
+        fraction of actions kept, and fraction of pruned calls where the reference solution's next move was pruned (None
+        unless misses are tracked). use it to tune candidates for a grid size: a high miss rate means candidates is too
+        small
+        """
+        calls = self.pruning_stats["calls"]
+        if calls == 0:
+            return {"kept": 1.0, "missed_best": 0.0 if self.track_misses else None}
+        missed = self.pruning_stats["missed_best"] / calls if self.track_misses else None
+        return {"kept": self.pruning_stats["offered"] / self.pruning_stats["total"], "missed_best": missed}
     
     def result(self, state, action):
         """
@@ -38,7 +132,10 @@ class ToolpathProblem(Problem):
         # print("************* ", ret_state[0].numLinesTraversed())
         # change action line to be traversed and change current point
         action_line = action[0]
-        for line in ret_state[0].getLines():
+        # merged polylines (or their unprinted runs) are matched against the grid's polylines, plain segments against the
+        # tile lines
+        candidates = ret_state[0].getLines() if isinstance(action_line, Line) else ret_state[0].getUnprintedUnits()
+        for line in candidates:
             # print(line, " | ", action_line, end="")
             if line == action_line:
                 # print(" *", end="")
@@ -49,7 +146,7 @@ class ToolpathProblem(Problem):
                 else:
                     ret_state.append(line.p0)
             # print()
-        ret_state.append(Point.distance(state[2], action[1]))  # distance of travel
+        ret_state.append(self.cost_model.travelCost(state[2], action[1]))  # cost of travel
 
         return ret_state
     
@@ -65,29 +162,41 @@ class ToolpathProblem(Problem):
     
     def path_cost(self, c, state1, action, state2):
         """
-        return distance between the current point in state1 to the point traveled to by action
+        return cost of travelling from the current point in state1 to the point traveled to by action, plus the cost of
+        printing the action's line (zero for the distance model)
         """
         old_point = state1[2]
         new_point = action[1]
-        return c + Point.distance(old_point, new_point)
+        return c + self.cost_model.travelCost(old_point, new_point) + self.cost_model.printCost(action[0])
     
     def value(self, state):
         """
-        value is the maximum possible travel distance (diagonal of grid) minus the distance of the last non-extrude movement.
+        value is the maximum possible travel cost (diagonal of grid) minus the cost of the last non-extrude movement.
         Basically, local searches will attempt to maximize this, which will minimize the distance travelled to get to this state.
         """
         # print(state)
-        return (state[0].numLinesTraversed() * state[0].num_columns * state[0].w * np.sqrt(2)) - state[3]
+        grid = state[0]
+        max_travel = self.cost_model.travelCost(Point(0, 0), Point(grid.num_columns * grid.w, grid.num_columns * grid.w))
+        return (grid.numLinesTraversed() * max_travel) - state[3]
     
     def totalCost(self, action_sequence, add_cost=None):
         """
-        given action sequence, return cost of non-extruding movements
+        given action sequence, return cost of non-extruding movements plus the cost of printing the lines (the latter is
+        zero for the distance model). travel costs are evaluated in one vectorized cost model call
         """
         ret_cost = 0 if add_cost is None else add_cost
+        if len(action_sequence) == 0:
+            return ret_cost
+        end_points = []
+        start_points = []
         for i in range(len(action_sequence) - 1):
             line_end_point = action_sequence[i][0].p0 if action_sequence[i][1] == action_sequence[i][0].p1 else action_sequence[i][0].p1  # ending point of old line
             line_start_point = action_sequence[i + 1][1]  # starting point of new line
-            ret_cost += Point.distance(line_end_point, line_start_point)
+            end_points.append((line_end_point.x, line_end_point.y))
+            start_points.append((line_start_point.x, line_start_point.y))
+        if len(end_points) > 0:
+            ret_cost += float(np.sum(self.cost_model.travelCosts(np.array(end_points), np.array(start_points))))
+        ret_cost += float(np.sum(self.cost_model.printCosts(np.array([action[0].length() for action in action_sequence]))))
         return ret_cost
     
     # def h(self, node):
@@ -95,6 +204,16 @@ class ToolpathProblem(Problem):
     #     last_distance = 
 
 
+def leftmostEscape(state, actions):
+    """
+    default escape set for candidate pruning: both ends of the printable line furthest left, so the search can always
+    go back and finish the left side of the grid instead of drifting away from it
+    """
+    lefts = [min(action[0].p0.x, action[0].p1.x) for action in actions]
+    leftmost = min(lefts)
+    return [i for i in range(len(actions)) if lefts[i] == leftmost]
+
+
 def main():
     """
     results:
@@ -114,9 +233,12 @@ def main():
     # grid1.tiles[1][0].angle = -30.346
     # grid1.tiles[1][1].angle = -44.004
     grid1.genTileLines()
+    grid1.mergeTileLines()  # lines meeting at tile borders are printed as one polyline
 
     # initialize grid for problem: first toolpath is bottom left, ending point of movement is the higher one.
     init_line = grid1.tiles[0][0].lines[0]
+    if init_line.polyline is not None:
+        init_line = init_line.polyline
     init_line.traversed = True
     init_endpoint = None
     starting_point = None
@@ -151,8 +273,11 @@ def main():
     for action in result.solution(): line_sequence.append(action[0])
 
     # getting total solution cost (sum of non-extruded travels)
-    total_cost = grid_prob_1.totalCost(result.solution(), Point.distance(init_endpoint, result.solution()[0][1]))
+    total_cost = grid_prob_1.totalCost(result.solution(), grid_prob_1.cost_model.travelCost(init_endpoint, result.solution()[0][1]))
     print(total_cost)
+    # every sequence starts by printing the first line from its starting point, so the bound from there applies
+    bound = lowerBound(LineSet(grid1, grid_prob_1.cost_model), (starting_point.x, starting_point.y))
+    print(f"lower bound {round(bound, 4)}, optimality gap {round(100 * optimalityGap(total_cost, bound), 1)}%")
 
     showGridLines(grid1, point_sequence, line_sequence)
 
@@ -0,0 +1,212 @@
+"""
+on disk cache of generated line sets and solved sequences, keyed by a hash of the grid's contents.
+
+two kinds of entries, both .npz files named by a sha256 of what they depend on:
+    lines-<hash>.npz     tile line endpoints. depends on the angles, tile size, spacing and angle range
+    solution-<hash>.npz  a solved order. also depends on start point, cost model and search limits (passes, target gap)
+so a grid that has been solved before is loaded instead of regenerated and searched again, and a grid that has only
+been built before at least skips line generation.
+
+the cache is meant to be shared by several worker processes:
+    - entries are written to a temp file and moved into place with os.replace, so readers never see half a file
+    - a hit updates the entry's mtime, and eviction removes the least recently used entries until the directory is
+      under max_bytes. writes and eviction hold an exclusive lock on <directory>/.lock (fcntl, where available)
+    - an entry that disappears between listing and reading (evicted by another process) is just a miss
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+import numpy as np
+from Grid import Grid
+from LayerPlanner import Layer
+from Line import Line
+from LineSet import LineSet
+from LowerBound import lowerBound
+from Point import Point
+
+try:
+    import fcntl
+except ImportError:  # no file locking outside of POSIX. writes are still atomic, eviction may race
+    fcntl = None
+
+LINES_FORMAT = 2  # bumped when generated lines change (2: segment ends in baseline border order), so old entries miss
+
+
+class SolutionCache:
+    def __init__(self, directory, max_bytes=256 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock_path = os.path.join(self.directory, ".lock")
+
+    # keys
+    @staticmethod
+    def _hash(*parts):
+        h = hashlib.sha256()
+        for part in parts:
+            h.update(part if isinstance(part, bytes) else repr(part).encode())
+            h.update(b"|")
+        return h.hexdigest()
+
+    @staticmethod
+    def linesKey(spec):
+        angles = np.round(np.asarray(spec.angles, dtype=float), 9)
+        return SolutionCache._hash(LINES_FORMAT, angles.shape, angles.tobytes(), spec.w, spec.offset, spec.min_angle, spec.max_angle)
+
+    @staticmethod
+    def solutionKey(spec):
+        model = spec.cost_model
+        model_key = None if model is None else (type(model).__name__, sorted(vars(model).items()))
+        return SolutionCache._hash(SolutionCache.linesKey(spec), tuple(spec.start_point), model_key, spec.max_passes, spec.target_gap)
+
+    # file handling
+    def _path(self, kind, key):
+        return os.path.join(self.directory, f"{kind}-{key}.npz")
+
+    def _load(self, kind, key):
+        path = self._path(kind, key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(path)  # mark as recently used
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        return arrays
+
+    def _store(self, kind, key, **arrays):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            with self._lock():
+                os.replace(tmp_path, self._path(kind, key))
+                self._evict()
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _lock(self):
+        return _FileLock(self.lock_path)
+
+    def _evict(self):
+        """
+        remove least recently used entries until the cache fits in max_bytes. caller holds the lock
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        with self._lock():
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".npz"):
+                    os.remove(entry.path)
+
+    # line sets and solutions
+    def lineSet(self, spec):
+        """
+        LineSet for spec, loaded from the cache if possible, otherwise generated and stored
+        """
+        key = self.linesKey(spec)
+        arrays = self._load("lines", key)
+        if arrays is None:
+            line_set = spec.buildLineSet()
+            counts = np.array(line_set.tile_count, dtype=np.int64).reshape(line_set.num_rows, line_set.num_columns)
+            self._store("lines", key, ends=line_set.ends, counts=counts)
+            return line_set
+
+        # rebuild the grid with the cached lines instead of generating them
+        grid = Grid(len(spec.angles), len(spec.angles[0]), spec.min_angle, spec.max_angle, spec.w, spec.offset)
+        grid.seedAngles(spec.angles)
+        ends = arrays["ends"].tolist()
+        n = 0
+        for i in range(grid.num_rows):
+            for j in range(grid.num_columns):
+                for _ in range(int(arrays["counts"][i][j])):
+                    (x0, y0), (x1, y1) = ends[n]
+                    grid.tiles[i][j].lines.append(Line(Point(x0, y0), Point(x1, y1)))
+                    n += 1
+        return LineSet(grid, spec.cost_model)
+
+    def loadSolution(self, spec):
+        """
+        cached solved Layer for spec, or None. the layer carries the lower bound stored with it, if there is one
+        """
+        t = time.time()
+        arrays = self._load("solution", self.solutionKey(spec))
+        if arrays is None:
+            return None
+        line_set = self.lineSet(spec)
+        order = [tuple(a) for a in arrays["order"].tolist()]
+        bound = float(arrays["bound"]) if "bound" in arrays else np.nan  # entries from before bounds were stored
+        return Layer(line_set.grid, line_set, order, spec.start_point, time.time() - t, int(arrays["passes"]), None if np.isnan(bound) else bound)
+
+    def solve(self, spec):
+        """
+        solved Layer for spec: the cached solution if there is one, otherwise greedy start + LineSet.improveOrder (up to
+        spec.target_gap, if set), which is then stored
+        """
+        layer = self.loadSolution(spec)
+        if layer is not None:
+            return layer
+        t = time.time()
+        line_set = self.lineSet(spec)
+        bound = None if spec.target_gap is None else lowerBound(line_set, spec.start_point)
+        order = line_set.greedyOrder(spec.start_point)
+        order, passes = line_set.improveOrder(order, spec.start_point, spec.max_passes, bound=bound, target_gap=spec.target_gap)
+        self.storeSolution(spec, order, passes, bound)
+        return Layer(line_set.grid, line_set, order, spec.start_point, time.time() - t, passes, bound)
+
+    def storeSolution(self, spec, order, passes, bound=None):
+        """
+        bound: the line set's lower bound, if it was computed, so a later hit can report the gap without recomputing it
+        """
+        self._store("solution", self.solutionKey(spec), order=np.array(order, dtype=np.int64).reshape(-1, 2), passes=np.array(passes),
+                    bound=np.array(np.nan if bound is None else bound))
+
+
+class _FileLock:
+    """
+    exclusive advisory lock on a file, held for the duration of a with block
+    """
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
+
+
+if __name__ == "__main__":
+    from Jobs import GridSpec
+
+    grid = Grid(4, 4, -45, 0, 1, .1)
+    grid.randomGenAngles(-45, 45)
+    angles = [[grid.tiles[i][j].angle for j in range(grid.num_columns)] for i in range(grid.num_rows)]
+    cache = SolutionCache(os.path.join(tempfile.gettempdir(), "toolpath_cache"))
+    for n in range(2):
+        print(cache.solve(GridSpec(angles, 1, .1)))
@@ -1,6 +1,6 @@
-import copy
 import matplotlib.pyplot as plt
 import numpy as np
+import Geometry
 from Line import Line
 from Point import Point
 
@@ -24,15 +24,19 @@ class Tile:
         self.s_max = s_max
         self.lines = []  # list of lines, each in the form [[x0, y0], [x1, y1]]. Although no travel order should be determined from 0 or 1 subscript
         self.center = Point(self.p0.x + (w/2), self.p0.y + (w/2))  # useful to have
+        self.dirty = True  # angle changed since lines were last generated (see Grid.regenDirtyTiles)
         self._initializeBorders()
 
         if self.angle is not None:  # angle can be initialized to zero. must be set before calling any Tile methods tho 
             self._normalizeAngle()  # bring angle to within (-90, 90)
     
     def setAngle(self, new_angle):
+        old_angle = self.angle
         self.angle = new_angle
         if self.angle is not None:
             self._normalizeAngle()
+        if self.angle != old_angle:
+            self.dirty = True
 
     def getBorderPoints(self, border_char):
         """
@@ -48,7 +52,7 @@ class Tile:
         return ret_points
 
     def _normalizeAngle(self):
-        self.angle = (np.abs(self.angle) % 180) * (np.abs(self.angle) / self.angle)
+        self.angle = (np.abs(self.angle) % 180) * np.sign(self.angle)
         if self.angle > 90:  # quad II
             self.angle -= 180
         elif self.angle > 0:  # quad I, okay
@@ -79,66 +83,70 @@ class Tile:
         generate lines in a tile, given a seed point and the angle of the tile. If lines already exist, this will clear them first. If
         the line resulting from the tile and and seed point is not in the tile, also returns False
         """
-        slope = np.tan(self.angle * (np.pi / 180))
-        if np.abs(slope) > 10**5:  # vertical line
-            slope = None
-            seed_line = Line(point, Point(point.x, point.y + 1))
-        else:  # defined slope
-            if np.abs(slope) < 10**(-5):  # essentially zero slope
-                slope = 0
-            seed_line = Line(point, Point(point.x + 1, point.y + slope))
-        
+        direction = Geometry.directionFromAngle(self.angle)
+        seed_line = Line(point, Point(point.x + direction[0], point.y + direction[1]))
         if not self.inTile(seed_line):  # ensure seed line is in tile
             return False
-        
+
+        # every line that can hit the tile is within a tile diagonal of the seed, so clip all candidate offsets at once:
+        # k = 0, 1, 2, ... in the positive orthogonal direction then k = -1, -2, ... in the negative one
         offset = self.s_max if offset is None else offset  # use default offset if none given
+        n = int(np.ceil(np.sqrt(2) * self.w / offset)) + 1
+        ks = np.concatenate((np.arange(0, n + 1), -np.arange(1, n + 1)))
+        normal = Geometry.orthogonalNormal(direction)
+        points = np.array((point.x, point.y)) + ks[:, None] * offset * normal
+        segments, valid = Geometry.clipSegments(points, np.tile(direction, (len(ks), 1)), self.getBox(), self.w / 10)  # w / 10 is arbitrary, makes viewing easier
+        segments = Geometry.orderByBorder(segments, self.getBox())
+
         self.lines.clear()
-        initial_line = copy.deepcopy(seed_line)
-        while self.addLine(copy.deepcopy(seed_line)):  # translate in positive orthogonal direction
-            seed_line.translateOrthogonal(offset)
+        self.dirty = False
+        for stop_at in (ks >= 0, ks < 0):  # same order as translating one step at a time, stopping at the first miss
+            for i in np.nonzero(stop_at)[0]:
+                if not valid[i]:
+                    break
+                self._insertLine(Line(Point(*segments[i][0].tolist()), Point(*segments[i][1].tolist())))
 
-        seed_line = initial_line
-        seed_line.translateOrthogonal(-offset)
-        while self.addLine(copy.deepcopy(seed_line)):  # translate in negative orthogonal direction
-            seed_line.translateOrthogonal(-offset)
+    def getTemplate(self):
+        """
+        the tile's lines relative to its bottom left corner, as ((x0, y0), (x1, y1)) pairs. tiles with the same angle, side
+        length and spacing generate the same template, so it can be reused with genLinesFromTemplate
+        """
+        return tuple(((line.p0.x - self.p0.x, line.p0.y - self.p0.y), (line.p1.x - self.p0.x, line.p1.y - self.p0.y)) for line in self.lines)
+
+    def genLinesFromTemplate(self, template):
+        """
+        set this tile's lines from a template made by getTemplate (on this or any other tile). clears existing lines
+        """
+        self.lines.clear()
+        self.dirty = False
+        for (x0, y0), (x1, y1) in template:
+            self.lines.append(Line(Point(self.p0.x + x0, self.p0.y + y0), Point(self.p0.x + x1, self.p0.y + y1)))
 
     # helper functions for line stuff
+    def getBox(self):
+        """
+        tile bounds as (x_min, y_min, x_max, y_max)
+        """
+        return (self.p0.x, self.p0.y, self.p0.x + self.w, self.p0.y + self.w)
+
+    def _clip(self, line):
+        segments, valid = Geometry.clipSegments((line.p0.x, line.p0.y), line.direction(), self.getBox(), 10**(-5))
+        return Geometry.orderByBorder(segments, self.getBox())[0], bool(valid[0])
+
     def inTile(self, line: Line):
         """
         given a line segment, determine if the infinite line it falls on intersects with the tile.
         NOTE: if the given line falls on one of the borders, it is considered to be in the tile. if it intersects a corner, it is not.
         """
-        
-        # determine how many corners are intersected.
-        corners_intersected = 0
-        for border in self.border_lines:
-            if np.abs(line.orthogonalDistance(border.p0)) < 10**(-5):  # border.p0 will iterate over all four corner points
-                corners_intersected += 1
-        if corners_intersected == 1:  # only one corner intersected, so line is not considered to be in tile
-            return False
+        return self._clip(line)[1]
 
-        # logic synopsis here: if the infinite line represented by the line segment 'line' intersects any of the borders,
-        # it must intersect two of the borders (we don't consider colinearity intersection). Therefore, check if 'line' intersects
-        # any borders, and if it does return true.
-        for border_line in self.border_lines:
-            if border_line.intersectsInfinite(line):
-                return True
-        return False  # at this point, no intersections were found. line not in tile.
-    
     def lineSegInTile(self, line):
         """
         given a line segment, return a new, colinear line segment that intersects the tile on its borders. assumes the given
         line segment intersects the tile border at two places - ie, not exactly on a corner.
         """
-        intersections = [None, None, None, None]  # indicates intersection points of (L, T, R, B) border segments with given line
-        for i in range(4):
-            border = self.border_lines[i]
-            if border.intersectsInfinite(line):
-                intersections[i] = Line.intersectionPoint(border, line)
-        
-        while None in intersections:  # this function assumes the line will intersect this tile border set at two points, so remove the two None's to get the points
-            intersections.remove(None)
-        return Line(intersections[0], intersections[1])  # make line from two remaining points
+        segment, valid = self._clip(line)
+        return Line(Point(*segment[0].tolist()), Point(*segment[1].tolist()))
 
     # functions for visualization:
     def getBorder(self):
@@ -161,19 +169,20 @@ class Tile:
             if seg_line.length() < self.w / 10:  # arbitrary, makes viewing easier
                 return False
 
-            if len(self.lines) == 0:  # no lines, just insert
-                self.lines.append(seg_line)
-                return True
-            
-            i = 0
-            while i < len(self.lines) and seg_line > self.lines[i]:  # keep incrementing i such that i is the index that the new line needs to be inserted at
-                i += 1
-            
-            self.lines.insert(i, seg_line)
+            self._insertLine(seg_line)
             return True
         else:
             return False
 
+    def _insertLine(self, seg_line):
+        """
+        insert an already clipped line so self.lines stays in bottom to top order
+        """
+        i = 0
+        while i < len(self.lines) and seg_line > self.lines[i]:  # keep incrementing i such that i is the index that the new line needs to be inserted at
+            i += 1
+        self.lines.insert(i, seg_line)
+
     def getLines(self):
         """
         get the lines in a tile in a 3D tuple of the format: